@@ -7,17 +7,17 @@ from PySide6.QtCore import Qt, QTimer
 from PySide6.QtGui import QColor, QIcon, QPalette, QPixmap
 from PySide6.QtWidgets import (QApplication, QComboBox, QFileDialog,
                                QMainWindow, QProxyStyle, QStyle, QVBoxLayout)
-from matplotlib import colors
 from matplotlib import pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT
 
 from colour_controls import ColourManager
+from colouring import colour_image, colour_lut, shade_image
 from config import *
-from fractal_calculation import fractal_set
+from fractal_calculation import adaptive_supersample, fractal_set
 from fractal_controls import (CoordinateManager, FractalControls,
                               ImageRenderer, JuliaParameterControl,
-                              polar_coordinates)
+                              RenderWorker, polar_coordinates)
 from ui_form_MandelbrotJulia import Ui_MainWindowMandelbrotJulia
 from ui_form_Save import Ui_Save
 
@@ -130,21 +130,30 @@ class ImageExporter:
         xmin, xmax = self.ax.get_xlim()
         ymin, ymax = self.ax.get_ylim()
         print(xmin, xmax, ymin, ymax, self.x_c, self.y_c, self.horizon)
-        data = fractal_set(xmin, xmax, ymin, ymax, x_c=self.x_c, y_c=self.y_c,
-                           height=img_height * ss_factor, length=img_width * ss_factor,
-                           n=self.n, horizon=self.horizon, power=self.power,
-                           mode=self.mode)[2].T
+        transform = None
         if self.regime == 'sin':
-            data = (np.sin(data * self.freq + self.offset)) ** 2
-        data = data.reshape((img_height, ss_factor, img_width, ss_factor)).mean(axis=(1, 3))
+            transform = lambda values: (np.sin(values * self.freq + self.offset)) ** 2
+        if ss_factor == 1:
+            kwargs = dict(x_c=self.x_c, y_c=self.y_c, height=img_height, length=img_width, n=self.n,
+                          horizon=self.horizon, power=self.power, mode=self.mode)
+            if self.save_image_dialog.ui.checkBox_store.isChecked():
+                # Exports kept in the tile store are read from the disk when the same view is saved again
+                data = self.render_worker.tile_store.render(xmin, xmax, ymin, ymax, **kwargs).T
+            else:
+                data = fractal_set(xmin, xmax, ymin, ymax, **kwargs)[2].T
+            if transform is not None:
+                data = transform(data)
+        else:
+            data = adaptive_supersample(xmin, xmax, ymin, ymax, x_c=self.x_c, y_c=self.y_c, height=img_height,
+                                        length=img_width, n=self.n, horizon=self.horizon, supersampling=ss_factor,
+                                        power=self.power, mode=self.mode, transform=transform).T
         if self.save_image_dialog.ui.checkBox_withAxes.isChecked():
             _, ax = plt.subplots(figsize=(length, height), dpi=dpi)
             if not self.shading:
                 ax.imshow(data, origin='lower', cmap=self.colourmap, extent=(xmin, xmax, ymin, ymax))
             else:
-                light = colors.LightSource(azdeg=self.azdeg, altdeg=self.altdeg)
-                data = light.shade(data, cmap=plt.get_cmap(self.colourmap), vert_exag=self.vert_exag,
-                                   blend_mode='hsv')
+                data = shade_image(data, colour_lut(self.colourmap, bytes=False), self.azdeg, self.altdeg,
+                                   self.vert_exag, origin='upper')
                 ax.imshow(data, extent=(xmin, xmax, ymin, ymax), origin='lower')
             ax.tick_params(labelsize='xx-large')
             ax.xaxis.offsetText.set_fontsize('xx-large')
@@ -153,12 +162,10 @@ class ImageExporter:
             plt.savefig(filename, dpi=dpi)
         else:
             if not self.shading:
-                plt.imsave(filename, data, cmap=self.colourmap, origin='lower')
+                plt.imsave(filename, colour_image(data, colour_lut(self.colourmap)))
             else:
-                light = colors.LightSource(azdeg=self.azdeg, altdeg=self.altdeg)
-                data = light.shade(data, cmap=plt.get_cmap(self.colourmap), vert_exag=self.vert_exag,
-                                   blend_mode='hsv')
-                plt.imsave(filename, data, origin='lower')
+                plt.imsave(filename, shade_image(data, colour_lut(self.colourmap, bytes=False), self.azdeg,
+                                                 self.altdeg, self.vert_exag))
         QMessageBox.information(self, 'Save File', f'Image is saved to {filename}')
         self.save_image_dialog.ui.pushButton_Save.setEnabled(True)
 
@@ -220,6 +227,7 @@ class ImageExporter:
             metadata['vert_exag'] = self.vert_exag
         with open(path, 'w') as f:
             json.dump(metadata, f, indent=2)
+        self.render_worker.store_last()  # loading the metadata reopens the view from the tile store
 
     def load_metadata(self, path):
         with open(path, 'r') as f:
@@ -324,6 +332,12 @@ class MJSet(MyWindowMandelbrotJulia, FractalControls, CoordinateManager, JuliaPa
         self.delta_slider_yc = DEFAULT_DELTA_SLIDER_C
         self.invalid_slider = False
         self.cache = None
+        self.render_id = 0
+        self.render_extent = None
+        self.c_preview, self.preview_scale = False, PREVIEW_MAX_SCALE / 4
+        self.preview_id, self.preview_start = None, 0.0
+        self.render_worker = RenderWorker(self)
+        self.render_worker.pass_ready.connect(self.show_render_pass, Qt.QueuedConnection)
 
         # Initialise dialogues and toolbar
         self.main_layout = None
@@ -420,6 +434,8 @@ class MJSet(MyWindowMandelbrotJulia, FractalControls, CoordinateManager, JuliaPa
         self.ui.horizontalSlider_N.valueChanged.connect(self.change_n)
         self.ui.horizontalSlider_XC.valueChanged.connect(self.set_c_from_slider)
         self.ui.horizontalSlider_YC.valueChanged.connect(self.set_c_from_slider)
+        self.ui.horizontalSlider_XC.sliderReleased.connect(self.finish_c_preview)
+        self.ui.horizontalSlider_YC.sliderReleased.connect(self.finish_c_preview)
 
         # Button actions
         for button, action in (
@@ -0,0 +1,182 @@
+import math
+
+import numpy as np
+from matplotlib import pyplot as plt
+from numba import njit, prange
+
+
+def colour_lut(colourmap, bytes=True):
+    """RGBA lookup table of a colourmap, as bytes (or floats with bytes=False), followed by the colour of NaN."""
+    cmap = plt.get_cmap(colourmap)
+    return np.concatenate((cmap(np.arange(cmap.N), bytes=bytes), cmap(np.array([np.nan]), bytes=bytes)))
+
+
+@njit(fastmath=False, cache=True)
+def _regime_value(value, sin, freq, offset):
+    if sin:
+        return math.sin(value * freq + offset) ** 2
+    return value
+
+
+@njit(parallel=True, fastmath=False, cache=True)
+def _value_range(image, sin, freq, offset):
+    height, length = image.shape
+    row_min, row_max = np.full(height, np.inf), np.full(height, -np.inf)
+    for y in prange(height):
+        for x in range(length):
+            value = _regime_value(image[y, x], sin, freq, offset)
+            if value < row_min[y]:
+                row_min[y] = value
+            if value > row_max[y]:
+                row_max[y] = value
+    return row_min.min(), row_max.max()
+
+
+@njit(parallel=True, fastmath=False, cache=True)
+def _colour_image(image, lut, sin, freq, offset, vmin, vmax, rgba):
+    # Same arithmetic as matplotlib's Normalize and Colormap, so that the colours are those
+    # of imshow and imsave
+    height, length = image.shape
+    colours = lut.shape[0] - 1
+    for y in prange(height):
+        for x in range(length):
+            value = _regime_value(image[y, x], sin, freq, offset)
+            if value != value:
+                index = colours
+            else:
+                scaled = (value - vmin) / (vmax - vmin) * colours if vmax > vmin else 0.0
+                index = min(max(int(scaled), 0), colours - 1)
+            for channel in range(4):
+                rgba[y, x, channel] = lut[index, channel]
+    return rgba
+
+
+def colour_image(image, lut, regime='standard', freq=0.0, offset=0.0, origin='lower', out=None):
+    """Colours an image indexed [y, x] into RGBA bytes, flipped for origin='lower' as imsave does."""
+    if origin not in {'lower', 'upper'}:
+        raise ValueError('Origin must be lower or upper.')
+    if regime not in {'standard', 'sin'}:
+        raise ValueError('Invalid regime.')
+    sin = regime == 'sin'
+    if out is None:
+        out = np.empty(image.shape + (4,), dtype=np.uint8)
+    vmin, vmax = _value_range(image, sin, float(freq), float(offset))
+    if origin == 'lower':
+        image = image[::-1]
+    return _colour_image(image, lut, sin, float(freq), float(offset), vmin, vmax, out)
+
+
+@njit(parallel=True, fastmath=False, cache=True)
+def _hillshade(image, sin, freq, offset, vert_exag, direction, intensity):
+    # LightSource.hillshade: normals from np.gradient of the exaggerated elevation, with rows
+    # going downwards (dy = -1), dotted with the direction of the light
+    height, length = image.shape
+    row_min, row_max = np.full(height, np.inf), np.full(height, -np.inf)
+    for y in prange(height):
+        y0, y1 = max(y - 1, 0), min(y + 1, height - 1)
+        for x in range(length):
+            x0, x1 = max(x - 1, 0), min(x + 1, length - 1)
+            e_dx = (vert_exag * _regime_value(image[y, x1], sin, freq, offset)
+                    - vert_exag * _regime_value(image[y, x0], sin, freq, offset)) / (x1 - x0)
+            e_dy = (vert_exag * _regime_value(image[y1, x], sin, freq, offset)
+                    - vert_exag * _regime_value(image[y0, x], sin, freq, offset)) / (y0 - y1)
+            magnitude = math.sqrt(e_dx ** 2 + e_dy ** 2 + 1.0)
+            value = (-e_dx / magnitude * direction[0] - e_dy / magnitude * direction[1]
+                     + 1.0 / magnitude * direction[2])
+            intensity[y, x] = value
+            if value < row_min[y]:
+                row_min[y] = value
+            if value > row_max[y]:
+                row_max[y] = value
+    return row_min.min(), row_max.max()
+
+
+@njit(fastmath=False, cache=True)
+def _blend_hsv(r, g, b, intensity):
+    # LightSource.blend_hsv with its default bounds, lit pixels going towards white (s = 0,
+    # v = 1) and shaded ones towards black (s = 1, v = 0), through rgb_to_hsv and hsv_to_rgb
+    v = max(r, g, b)
+    delta = v - min(r, g, b)
+    s = delta / v if v > 0 else 0.0
+    h = 0.0
+    if delta > 0:
+        if b == v:
+            h = 4.0 + (r - g) / delta
+        elif g == v:
+            h = 2.0 + (b - r) / delta
+        else:
+            h = (g - b) / delta
+    h = (h / 6.0) % 1.0
+    intensity = 2 * intensity - 1
+    if abs(s) > 1e-10 and intensity > 0:
+        s = (1 - intensity) * s
+    elif abs(s) > 1e-10 and intensity < 0:
+        s = (1 + intensity) * s - intensity
+    if intensity > 0:
+        v = (1 - intensity) * v + intensity
+    elif intensity < 0:
+        v = (1 + intensity) * v
+    s, v = min(max(s, 0.0), 1.0), min(max(v, 0.0), 1.0)
+    if s == 0:
+        return v, v, v
+    i = int(h * 6.0)
+    f = h * 6.0 - i
+    p, q, t = v * (1.0 - s), v * (1.0 - s * f), v * (1.0 - s * (1.0 - f))
+    if i % 6 == 0:
+        return v, t, p
+    if i == 1:
+        return q, v, p
+    if i == 2:
+        return p, v, t
+    if i == 3:
+        return p, q, v
+    if i == 4:
+        return t, p, v
+    return v, p, q
+
+
+@njit(parallel=True, fastmath=False, cache=True)
+def _shade_image(image, lut, sin, freq, offset, vmin, vmax, intensity, imin, imax, rgba):
+    height, length = image.shape
+    colours = lut.shape[0] - 1
+    for y in prange(height):
+        for x in range(length):
+            value = _regime_value(image[y, x], sin, freq, offset)
+            if value != value:
+                index = colours
+            else:
+                scaled = (value - vmin) / (vmax - vmin) * colours if vmax > vmin else 0.0
+                index = min(max(int(scaled), 0), colours - 1)
+            # Rescaled to [0, 1] as in LightSource.shade_normals, unless the slope is constant
+            light = intensity[y, x]
+            if imax - imin > 1e-6:
+                light = (light - imin) / (imax - imin)
+            light = min(max(light, 0.0), 1.0)
+            r, g, b = _blend_hsv(lut[index, 0], lut[index, 1], lut[index, 2], light)
+            rgba[y, x, 0] = np.uint8(r * 255)
+            rgba[y, x, 1] = np.uint8(g * 255)
+            rgba[y, x, 2] = np.uint8(b * 255)
+            rgba[y, x, 3] = np.uint8(lut[index, 3] * 255)
+    return rgba
+
+
+def shade_image(image, lut, azdeg, altdeg, vert_exag, regime='standard', freq=0.0, offset=0.0,
+                origin='lower', out=None):
+    """Compiled counterpart of LightSource.shade with blend_mode='hsv', followed by the conversion to bytes."""
+    if origin not in {'lower', 'upper'}:
+        raise ValueError('Origin must be lower or upper.')
+    if regime not in {'standard', 'sin'}:
+        raise ValueError('Invalid regime.')
+    if min(image.shape) < 2:
+        raise ValueError('Shading needs at least 2 pixels along each axis.')
+    sin = regime == 'sin'
+    if out is None:
+        out = np.empty(image.shape + (4,), dtype=np.uint8)
+    az, alt = np.radians(90 - azdeg), np.radians(altdeg)
+    direction = np.array([np.cos(az) * np.cos(alt), np.sin(az) * np.cos(alt), np.sin(alt)])
+    intensity = np.empty(image.shape)
+    imin, imax = _hillshade(image, sin, float(freq), float(offset), float(vert_exag), direction, intensity)
+    vmin, vmax = _value_range(image, sin, float(freq), float(offset))
+    rgba = out[::-1] if origin == 'lower' else out
+    _shade_image(image, lut, sin, float(freq), float(offset), vmin, vmax, intensity, imin, imax, rgba)
+    return out
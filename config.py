@@ -1,3 +1,5 @@
+import os
+
 from PySide6.QtWidgets import QDialog, QMessageBox
 
 
@@ -28,6 +30,16 @@ DEFAULT_C_VIEW = 'xy'
 DEFAULT_X_C = -0.8000
 DEFAULT_Y_C = -0.1560
 DEFAULT_DELTA_SLIDER_C = 5e-4  # 2 / 4000 = (1 - (-1)) / 4000
+PROGRESSIVE_STRIDES = (8, 4, 2, 1)  # Pixel strides of the successive passes of the interactive render
+RENDER_BAND = 32  # Columns computed between checks for a newer render request in the interactive view
+TILE_CACHE_MEMORY = 256 * 2 ** 20  # Memory cap of the tile cache of the interactive view, in bytes
+TILE_CACHE_SIZE = 64  # Pixels along each side of a tile of the tile cache
+PREVIEW_FRAME_TIME = 1 / 30  # Target render time of the previews while a C slider is dragged, in seconds
+PREVIEW_MAX_SCALE = 8.0  # Largest reduction of the resolution of the previews along each axis
+PREVIEW_N_FRACTION = 0.5  # Fraction of N used by the previews
+TILE_STORE_DIR = os.path.join(os.path.expanduser('~'), '.mandelbrot_julia', 'tiles')  # On-disk store of rendered fields
+TILE_STORE_DISK = 2 ** 30  # Disk cap of the tile store, in bytes
+EXP_MAP_BAND = 1024  # Rows of the exponential map of a zoom animation computed per call
 LIMS_MANDELBROT_DICT = {'2': (-2, 0.5, -1.25, 1.25), '3': (-1, 1, -1.35, 1.35),
                         '4': (-1.35, 1, -1.25, 1.25), '5': (-1, 1, -1, 1),
                         '6': (-1.3, 1.2, -1.2, 1.2), '7': (-1.25, 1.25, -1.3, 1.3),
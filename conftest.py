@@ -0,0 +1 @@
+# Puts the repository root on sys.path, so that a plain `pytest` finds the modules under test
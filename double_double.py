@@ -0,0 +1,107 @@
+from decimal import Decimal
+
+from numba import njit
+
+# Double-double numbers are unevaluated sums hi + lo of two float64 with |lo| <= ulp(hi) / 2,
+# giving about 32 significant digits. The error-free transformations below rely on exact
+# IEEE rounding, so none of these functions may be compiled with fastmath.
+
+_SPLITTER = 134217729.0  # 2^27 + 1
+
+
+def to_double_double(value):
+    """Splits a float, str or Decimal into the (hi, lo) pair closest to it."""
+    hi = float(value)
+    if isinstance(value, (str, Decimal)):
+        lo = float(Decimal(value) - Decimal(hi))
+    else:
+        lo = 0.0
+    return hi, lo
+
+
+@njit(inline='always')
+def two_sum(a, b):
+    s = a + b
+    bb = s - a
+    err = (a - (s - bb)) + (b - bb)
+    return s, err
+
+
+@njit(inline='always')
+def quick_two_sum(a, b):
+    s = a + b
+    err = b - (s - a)
+    return s, err
+
+
+@njit(inline='always')
+def _split(a):
+    t = _SPLITTER * a
+    hi = t - (t - a)
+    return hi, a - hi
+
+
+@njit(inline='always')
+def two_prod(a, b):
+    p = a * b
+    a_hi, a_lo = _split(a)
+    b_hi, b_lo = _split(b)
+    err = ((a_hi * b_hi - p) + a_hi * b_lo + a_lo * b_hi) + a_lo * b_lo
+    return p, err
+
+
+@njit(inline='always')
+def dd_add(a_hi, a_lo, b_hi, b_lo):
+    s, e = two_sum(a_hi, b_hi)
+    t, f = two_sum(a_lo, b_lo)
+    e += t
+    s, e = quick_two_sum(s, e)
+    e += f
+    return quick_two_sum(s, e)
+
+
+@njit(inline='always')
+def dd_sub(a_hi, a_lo, b_hi, b_lo):
+    return dd_add(a_hi, a_lo, -b_hi, -b_lo)
+
+
+@njit(inline='always')
+def dd_mul(a_hi, a_lo, b_hi, b_lo):
+    p, e = two_prod(a_hi, b_hi)
+    e += a_hi * b_lo + a_lo * b_hi
+    return quick_two_sum(p, e)
+
+
+@njit(inline='always')
+def dd_mul_f(a_hi, a_lo, b):
+    p, e = two_prod(a_hi, b)
+    e += a_lo * b
+    return quick_two_sum(p, e)
+
+
+@njit(inline='always')
+def dd_div_f(a_hi, a_lo, b):
+    q1 = a_hi / b
+    p, e = two_prod(q1, b)
+    r_hi, r_lo = dd_sub(a_hi, a_lo, p, e)
+    q2 = r_hi / b
+    return quick_two_sum(q1, q2)
+
+
+@njit(inline='always')
+def dd_abs(a_hi, a_lo):
+    if a_hi < 0.0 or (a_hi == 0.0 and a_lo < 0.0):
+        return -a_hi, -a_lo
+    return a_hi, a_lo
+
+
+@njit(inline='always')
+def dd_complex_mul(a_hi, a_lo, b_hi, b_lo, c_hi, c_lo, d_hi, d_lo):
+    """(a + ib) * (c + id) for double-double components."""
+    ac_hi, ac_lo = dd_mul(a_hi, a_lo, c_hi, c_lo)
+    bd_hi, bd_lo = dd_mul(b_hi, b_lo, d_hi, d_lo)
+    ad_hi, ad_lo = dd_mul(a_hi, a_lo, d_hi, d_lo)
+    bc_hi, bc_lo = dd_mul(b_hi, b_lo, c_hi, c_lo)
+    real_hi, real_lo = dd_sub(ac_hi, ac_lo, bd_hi, bd_lo)
+    imag_hi, imag_lo = dd_add(ad_hi, ad_lo, bc_hi, bc_lo)
+    return real_hi, real_lo, imag_hi, imag_lo
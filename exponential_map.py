@@ -0,0 +1,70 @@
+import math
+
+from numba import njit, prange
+
+
+def strip_geometry(delta_x_1, delta_y_1, delta_x_2, delta_y_2, length, height, supersampling=1):
+    """Returns (rho_min, rows, columns) of the `log_polar_set` strip holding every frame of the zoom."""
+    columns = int(math.ceil(math.pi * math.hypot(length - 1, height - 1) * supersampling))
+    step = 2 * math.pi / columns
+    rho_max = math.log(math.hypot(delta_x_1, delta_y_1) / 2) + step
+    rho_min = math.log(min(delta_x_2 / (length - 1), delta_y_2 / (height - 1)) / supersampling / 2) - step
+    return rho_min, int(math.ceil((rho_max - rho_min) / step)) + 1, columns
+
+
+@njit(fastmath=True, inline='always')
+def _strip_value(strip, b, a, n, sin, freq, offset):
+    # Values beyond n are those of points that do not escape within the n iterations of the
+    # frame, i.e. interior points of a render with n iterations
+    value = strip[b, a]
+    if value > n:
+        value = 0.0
+    if sin:
+        value = math.sin(value * freq + offset) ** 2
+    return value
+
+
+@njit(fastmath=True, inline='always')
+def _sample(strip, rho_min, step, x, y, n, sin, freq, offset):
+    # Bilinear interpolation of the strip at the offset (x, y) from the centre, periodic in
+    # the angle and clamped to the rows of the strip along the radius
+    rows, columns = strip.shape
+    radius2 = x * x + y * y
+    b = (0.5 * math.log(radius2) - rho_min) / step if radius2 > 0 else 0.0
+    b = min(max(b, 0.0), rows - 1.0)
+    a = math.atan2(y, x) / step
+    if a < 0:
+        a += columns
+    a0, b0 = int(math.floor(a)), int(math.floor(b))
+    fa, fb = a - a0, b - b0
+    a0 %= columns
+    a1, b1 = (a0 + 1) % columns, min(b0 + 1, rows - 1)
+    return ((1 - fb) * ((1 - fa) * _strip_value(strip, b0, a0, n, sin, freq, offset)
+                        + fa * _strip_value(strip, b0, a1, n, sin, freq, offset))
+            + fb * ((1 - fa) * _strip_value(strip, b1, a0, n, sin, freq, offset)
+                    + fa * _strip_value(strip, b1, a1, n, sin, freq, offset)))
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _remap(strip, rho_min, half_x, half_y, n, supersampling, sin, freq, offset, out):
+    height, length = out.shape
+    step = 2 * math.pi / strip.shape[1]
+    dx, dy = 2 * half_x / (length - 1), 2 * half_y / (height - 1)
+    for y in prange(height):
+        for x in range(length):
+            total = 0.0
+            for sy in range(supersampling):
+                oy = -half_y + (y + (sy + 0.5) / supersampling - 0.5) * dy
+                for sx in range(supersampling):
+                    ox = -half_x + (x + (sx + 0.5) / supersampling - 0.5) * dx
+                    total += _sample(strip, rho_min, step, ox, oy, n, sin, freq, offset)
+            out[y, x] = total / (supersampling * supersampling)
+    return out
+
+
+def remap_strip(strip, rho_min, half_x, half_y, n, out, supersampling=1, regime='standard', freq=0.0, offset=0.0):
+    """Fills `out`, indexed [y, x], with the supersampled view around the centre of the strip."""
+    if regime not in {'standard', 'sin'}:
+        raise ValueError('Invalid regime.')
+    return _remap(strip, float(rho_min), float(half_x), float(half_y), float(n), int(supersampling),
+                  regime == 'sin', float(freq), float(offset), out)
@@ -1,7 +1,15 @@
 import math
+import multiprocessing as mp
+import threading
+from fractions import Fraction
+from functools import lru_cache
 
 import numpy as np
-from numba import njit
+from numba import njit, prange, typeof
+
+from double_double import dd_abs, dd_add, dd_complex_mul, dd_div_f, dd_mul, dd_mul_f, dd_sub
+from perturbation import (_log_polar_perturbation_set, _perturbation_set, perturbation_reference,
+                          perturbation_required)
 
 
 @njit(fastmath=True, inline='always')
@@ -14,6 +22,33 @@ def _init_c_julia_burning_ship_julia(x, y, x_c, y_c):
     return x_c, y_c
 
 
+@njit(fastmath=True, inline='always')
+def _interior_none(x, y, radius2):
+    return False
+
+
+@njit(fastmath=True, inline='always')
+def _interior_mandelbrot_2(x, y, radius2):
+    # Main cardioid and period-2 bulb in closed form
+    x_q = x - 0.25
+    q = x_q * x_q + y * y
+    if q * (q + x_q) <= 0.25 * y * y:
+        return True
+    return (x + 1.0) * (x + 1.0) + y * y <= 0.0625
+
+
+@njit(fastmath=True, inline='always')
+def _interior_multibrot(x, y, radius2):
+    # Disc inscribed in the central hyperbolic component, touching its cusps
+    return x * x + y * y <= radius2
+
+
+def _central_component_radius(power):
+    """Radius of the largest disc around the origin inside the central component of the Multibrot set."""
+    rho = power ** (-1.0 / (power - 1))
+    return rho * (1.0 - 1.0 / power)
+
+
 @njit(fastmath=True, inline='always')
 def _update_mandelbrot_julia_2(real, imag, x_c, y_c):
     real0 = real
@@ -161,63 +196,1025 @@ def _update_burning_ship_8(real, imag, x_c, y_c):
     return real, imag
 
 
-@njit(parallel=True, fastmath=True)
-def fractal_set(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power=2, mode='mandelbrot'):
-    log_horizon = math.log(math.log(horizon))
-    r1 = np.linspace(xmin, xmax, length)
-    r2 = np.linspace(ymin, ymax, height)
-    n3 = np.empty((length, height))
+# Double-double kernel. These functions must not use fastmath, which would let LLVM
+# reassociate the error-free transformations of the double_double module away.
+@njit(inline='always')
+def _interior_none_dd(x_hi, x_lo, y_hi, y_lo, radius2):
+    return False
 
-    if mode in {'mandelbrot', 'burning_ship'}:
-        init_c = _init_c_mandelbrot_burning_ship
-    elif mode in {'julia', 'burning_ship_julia'}:
-        init_c = _init_c_julia_burning_ship_julia
-    else:
-        raise ValueError('Mode must be mandelbrot, julia, burning_ship, or burning_ship_julia.')
 
-    if mode in {'mandelbrot', 'julia'} and power == 2:
-        update = _update_mandelbrot_julia_2
-    elif mode in {'mandelbrot', 'julia'} and power == 3:
-        update = _update_mandelbrot_julia_3
-    elif mode in {'mandelbrot', 'julia'} and power == 4:
-        update = _update_mandelbrot_julia_4
-    elif mode in {'mandelbrot', 'julia'} and power == 5:
-        update = _update_mandelbrot_julia_5
-    elif mode in {'mandelbrot', 'julia'} and power == 6:
-        update = _update_mandelbrot_julia_6
-    elif mode in {'mandelbrot', 'julia'} and power == 7:
-        update = _update_mandelbrot_julia_7
-    elif mode in {'mandelbrot', 'julia'} and power == 8:
-        update = _update_mandelbrot_julia_8
-    elif mode in {'burning_ship', 'burning_ship_julia'} and power == 2:
-        update = _update_burning_ship_2
-    elif mode in {'burning_ship', 'burning_ship_julia'} and power == 3:
-        update = _update_burning_ship_3
-    elif mode in {'burning_ship', 'burning_ship_julia'} and power == 4:
-        update = _update_burning_ship_4
-    elif mode in {'burning_ship', 'burning_ship_julia'} and power == 5:
-        update = _update_burning_ship_5
-    elif mode in {'burning_ship', 'burning_ship_julia'} and power == 6:
-        update = _update_burning_ship_6
-    elif mode in {'burning_ship', 'burning_ship_julia'} and power == 7:
-        update = _update_burning_ship_7
-    elif mode in {'burning_ship', 'burning_ship_julia'} and power == 8:
-        update = _update_burning_ship_8
-    else:
+@njit(inline='always')
+def _interior_mandelbrot_2_dd(x_hi, x_lo, y_hi, y_lo, radius2):
+    x_q_hi, x_q_lo = dd_add(x_hi, x_lo, -0.25, 0.0)
+    x2_hi, x2_lo = dd_mul(x_q_hi, x_q_lo, x_q_hi, x_q_lo)
+    y2_hi, y2_lo = dd_mul(y_hi, y_lo, y_hi, y_lo)
+    q_hi, q_lo = dd_add(x2_hi, x2_lo, y2_hi, y2_lo)
+    t_hi, t_lo = dd_add(q_hi, q_lo, x_q_hi, x_q_lo)
+    t_hi, t_lo = dd_mul(q_hi, q_lo, t_hi, t_lo)
+    y4_hi, y4_lo = dd_mul_f(y2_hi, y2_lo, 0.25)
+    if dd_sub(t_hi, t_lo, y4_hi, y4_lo)[0] <= 0.0:
+        return True
+    x_b_hi, x_b_lo = dd_add(x_hi, x_lo, 1.0, 0.0)
+    x2_hi, x2_lo = dd_mul(x_b_hi, x_b_lo, x_b_hi, x_b_lo)
+    q_hi, q_lo = dd_add(x2_hi, x2_lo, y2_hi, y2_lo)
+    return dd_add(q_hi, q_lo, -0.0625, 0.0)[0] <= 0.0
+
+
+@njit(inline='always')
+def _interior_multibrot_dd(x_hi, x_lo, y_hi, y_lo, radius2):
+    x2_hi, x2_lo = dd_mul(x_hi, x_lo, x_hi, x_lo)
+    y2_hi, y2_lo = dd_mul(y_hi, y_lo, y_hi, y_lo)
+    q_hi, q_lo = dd_add(x2_hi, x2_lo, y2_hi, y2_lo)
+    return dd_add(q_hi, q_lo, -radius2, 0.0)[0] <= 0.0
+
+
+@njit(inline='always')
+def _update_dd(re_hi, re_lo, im_hi, im_lo, x_c_hi, x_c_lo, y_c_hi, y_c_lo, power, burning_ship):
+    # Every Burning Ship update equals (|x| + i|y|)^power + c, so a single complex
+    # power covers all modes and powers
+    if burning_ship:
+        re_hi, re_lo = dd_abs(re_hi, re_lo)
+        im_hi, im_lo = dd_abs(im_hi, im_lo)
+    p_re_hi, p_re_lo, p_im_hi, p_im_lo = re_hi, re_lo, im_hi, im_lo
+    for _ in range(power - 1):
+        p_re_hi, p_re_lo, p_im_hi, p_im_lo = dd_complex_mul(p_re_hi, p_re_lo, p_im_hi, p_im_lo,
+                                                            re_hi, re_lo, im_hi, im_lo)
+    re_hi, re_lo = dd_add(p_re_hi, p_re_lo, x_c_hi, x_c_lo)
+    im_hi, im_lo = dd_add(p_im_hi, p_im_lo, y_c_hi, y_c_lo)
+    return re_hi, re_lo, im_hi, im_lo
+
+
+# Mariani-Silver subdivision: tile size handed to one thread, and the size of
+# rectangles below which all pixels are computed instead of splitting further
+SUBDIVISION_TILE = 64
+SUBDIVISION_MIN_SIZE = 4
+# Orbit points closer than this fraction of the pixel size are treated as a cycle
+PERIODICITY_TOLERANCE = 1e-3
+# Largest mismatch, in pixels, between two grids that are still treated as the same
+# lattice when a panned view reuses the pixels of the previous one
+PAN_TOLERANCE = 1e-3
+# Significant bits of the pixel spacing of the grids produced by `aligned_zoom`
+ALIGNED_GRID_BITS = 10
+# Adaptive supersampling: pixels that differ from a neighbour by more than this fraction
+# of the value range of the image are supersampled, in bands of the supersampled grid of
+# at most this many bytes
+EDGE_TOLERANCE = 0.01
+SUPERSAMPLING_BAND_MEMORY = 2 ** 24
+# Per-pixel outputs of `fractal_fields`: smoothed escape iteration, number of iterations
+# done, final |z|^2, |dz/dc| (|dz/dz_0| for Julia sets) and whether the orbit did not escape
+FIELDS = ('value', 'count', 'magnitude', 'derivative', 'interior')
+FIELD_DTYPES = {'value': np.float64, 'count': np.int32, 'magnitude': np.float64, 'derivative': np.float64,
+                'interior': np.bool_}
+# Kernel launches are serialised: each one already uses every core, and the workqueue
+# threading layer of numba aborts on concurrent parallel launches from several threads.
+# Compilation happens outside of it, see _launch
+_KERNEL_LOCK = threading.Lock()
+# Status of a pixel in an IterationState: not iterated yet, still iterating after `count`
+# iterations, escaped at iteration `count`, or interior (pre-test or cycle)
+_NEW, _RUNNING, _ESCAPED, _INTERIOR = 0, 1, 2, 3
+# Empty mask handed to the kernels when every pixel is computed
+_NO_MASK, _NO_VALUES = np.empty((0, 0), dtype=np.bool_), np.empty((0, 0))
+
+
+@njit(fastmath=False, cache=True)
+def _grid(vmin, vmax, count):
+    # Explicitly without fastmath (it is otherwise inherited from the calling kernels),
+    # which would multiply by the reciprocal of count - 1: the coordinates are then those
+    # of np.linspace, exact on the grids of `exact_grid`
+    return np.linspace(vmin, vmax, count)
+
+
+@njit(inline='always')
+def _brent_step(distance_real, distance_imag, window, steps, tol):
+    # Brent's cycle detection: the saved orbit point is replaced after 1, 2, 4, ... steps,
+    # so any attracting cycle shorter than the current window is caught. Takes the distance
+    # of the new orbit point to the saved one and returns (cycle, save, window, steps)
+    if abs(distance_real) < tol and abs(distance_imag) < tol:
+        return True, False, window, steps
+    steps += 1
+    if steps == window:
+        return False, True, window * 2, 0
+    return False, False, window, steps
+
+
+@njit(fastmath=True, cache=True)
+def _escape_value(real, imag, x_c, y_c, n, horizon, log_horizon, log_power, julia, burning_ship, power,
+                  radius2, tol):
+    if _interior(real, imag, radius2, julia, burning_ship, power):
+        return 0.0
+    x_0, y_0 = _init_c(real, imag, x_c, y_c, julia)
+    val = 0.0
+    check_real, check_imag = real, imag
+    window, steps = 1, 0
+    for iteration in range(n):
+        if real * real + imag * imag > horizon:
+            val = iteration + 1 - (math.log(math.log(real * real + imag * imag)) - log_horizon) / log_power
+            break
+        real, imag = _update(real, imag, x_0, y_0, burning_ship, power)
+        cycle, save, window, steps = _brent_step(real - check_real, imag - check_imag, window, steps, tol)
+        if cycle:
+            break  # Periodic orbit, the point is in the set
+        if save:
+            check_real, check_imag = real, imag
+    return val
+
+
+@njit(fastmath=True, cache=True)
+def _subdivision_pixel(n3, known, i, j, r1, r2, x_c, y_c, n, horizon, log_horizon, log_power, julia,
+                       burning_ship, power, radius2, tol):
+    if not known[i, j]:
+        n3[i, j] = _escape_value(r1[i], r2[j], x_c, y_c, n, horizon, log_horizon, log_power, julia,
+                                 burning_ship, power, radius2, tol)
+        known[i, j] = True
+    return n3[i, j]
+
+
+@njit(fastmath=True, cache=True)
+def _subdivide_tile(n3, known, i0, i1, j0, j1, r1, r2, x_c, y_c, n, horizon, log_horizon, log_power,
+                    julia, burning_ship, power, radius2, tol):
+    """Fills the rectangle [i0, i1) x [j0, j1) of n3 by Mariani-Silver subdivision."""
+    stack = np.empty((64, 4), dtype=np.int64)
+    stack[0, 0], stack[0, 1], stack[0, 2], stack[0, 3] = i0, i1, j0, j1
+    top = 1
+    while top > 0:
+        top -= 1
+        a0, a1, b0, b1 = stack[top, 0], stack[top, 1], stack[top, 2], stack[top, 3]
+        if a1 - a0 <= SUBDIVISION_MIN_SIZE or b1 - b0 <= SUBDIVISION_MIN_SIZE:
+            for i in range(a0, a1):
+                for j in range(b0, b1):
+                    _subdivision_pixel(n3, known, i, j, r1, r2, x_c, y_c, n, horizon, log_horizon, log_power,
+                                       julia, burning_ship, power, radius2, tol)
+            continue
+        first = _subdivision_pixel(n3, known, a0, b0, r1, r2, x_c, y_c, n, horizon, log_horizon, log_power,
+                                   julia, burning_ship, power, radius2, tol)
+        uniform = True
+        for i in range(a0, a1):
+            for j in (b0, b1 - 1):
+                if _subdivision_pixel(n3, known, i, j, r1, r2, x_c, y_c, n, horizon, log_horizon, log_power,
+                                      julia, burning_ship, power, radius2, tol) != first:
+                    uniform = False
+        for j in range(b0, b1):
+            for i in (a0, a1 - 1):
+                if _subdivision_pixel(n3, known, i, j, r1, r2, x_c, y_c, n, horizon, log_horizon, log_power,
+                                      julia, burning_ship, power, radius2, tol) != first:
+                    uniform = False
+        if uniform:
+            for i in range(a0 + 1, a1 - 1):
+                for j in range(b0 + 1, b1 - 1):
+                    n3[i, j] = first
+                    known[i, j] = True
+            continue
+        # Children share the dividing row and column, so their borders are partly known already
+        am = (a0 + a1) // 2
+        bm = (b0 + b1) // 2
+        for c0, c1, d0, d1 in ((a0, am + 1, b0, bm + 1), (am, a1, b0, bm + 1),
+                               (a0, am + 1, bm, b1), (am, a1, bm, b1)):
+            stack[top, 0], stack[top, 1], stack[top, 2], stack[top, 3] = c0, c1, d0, d1
+            top += 1
+
+
+def periodicity_tolerance(xmin, xmax, ymin, ymax, length, height):
+    """Tolerance of the cycle detection, tied to the pixel size of the view."""
+    spacing = min(abs(xmax - xmin) / max(length - 1, 1), abs(ymax - ymin) / max(height - 1, 1))
+    return PERIODICITY_TOLERANCE * spacing
+
+
+def _mode_flags(mode, power):
+    """Translates the mode into the (julia, burning_ship) flags understood by the kernels."""
+    if mode not in {'mandelbrot', 'julia', 'burning_ship', 'burning_ship_julia'}:
+        raise ValueError('Mode must be mandelbrot, julia, burning_ship, or burning_ship_julia.')
+    if power not in range(2, 9):
         raise ValueError('Power must be between 2 and 8.')
+    return mode in {'julia', 'burning_ship_julia'}, mode in {'burning_ship', 'burning_ship_julia'}
+
+
+@njit(fastmath=True, inline='always')
+def _init_c(x, y, x_c, y_c, julia):
+    if julia:
+        return _init_c_julia_burning_ship_julia(x, y, x_c, y_c)
+    return _init_c_mandelbrot_burning_ship(x, y, x_c, y_c)
+
+
+@njit(fastmath=True, inline='always')
+def _interior(x, y, radius2, julia, burning_ship, power):
+    # The pre-test marks points of the central hyperbolic component of the Mandelbrot set
+    # as interior without iterating them
+    if julia or burning_ship:
+        return _interior_none(x, y, radius2)
+    if power == 2:
+        return _interior_mandelbrot_2(x, y, radius2)
+    return _interior_multibrot(x, y, radius2)
+
+
+@njit(inline='always')
+def _interior_dd(x_hi, x_lo, y_hi, y_lo, radius2, julia, burning_ship, power):
+    if julia or burning_ship:
+        return _interior_none_dd(x_hi, x_lo, y_hi, y_lo, radius2)
+    if power == 2:
+        return _interior_mandelbrot_2_dd(x_hi, x_lo, y_hi, y_lo, radius2)
+    return _interior_multibrot_dd(x_hi, x_lo, y_hi, y_lo, radius2)
 
+
+@njit(fastmath=True, inline='always')
+def _update(real, imag, x_c, y_c, burning_ship, power):
+    if burning_ship:
+        if power == 2:
+            return _update_burning_ship_2(real, imag, x_c, y_c)
+        elif power == 3:
+            return _update_burning_ship_3(real, imag, x_c, y_c)
+        elif power == 4:
+            return _update_burning_ship_4(real, imag, x_c, y_c)
+        elif power == 5:
+            return _update_burning_ship_5(real, imag, x_c, y_c)
+        elif power == 6:
+            return _update_burning_ship_6(real, imag, x_c, y_c)
+        elif power == 7:
+            return _update_burning_ship_7(real, imag, x_c, y_c)
+        return _update_burning_ship_8(real, imag, x_c, y_c)
+    if power == 2:
+        return _update_mandelbrot_julia_2(real, imag, x_c, y_c)
+    elif power == 3:
+        return _update_mandelbrot_julia_3(real, imag, x_c, y_c)
+    elif power == 4:
+        return _update_mandelbrot_julia_4(real, imag, x_c, y_c)
+    elif power == 5:
+        return _update_mandelbrot_julia_5(real, imag, x_c, y_c)
+    elif power == 6:
+        return _update_mandelbrot_julia_6(real, imag, x_c, y_c)
+    elif power == 7:
+        return _update_mandelbrot_julia_7(real, imag, x_c, y_c)
+    return _update_mandelbrot_julia_8(real, imag, x_c, y_c)
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _fractal_set(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power, julia, burning_ship,
+                 radius2, tol, subdivide, i0, i1, j0, j1, di, dj, known, values, n3):
+    # Only the pixels [i0:i1:di, j0:j1:dj] of the (length, height) grid are computed into
+    # n3 (of any layout and float dtype), and of them only those not marked in `known` (if
+    # it is not empty), which are copied from `values`. Subdivision ignores the mask
+    log_horizon = math.log(math.log(horizon))
+    r1 = _grid(xmin, xmax, length)[i0:i1:di].copy()
+    r2 = _grid(ymin, ymax, height)[j0:j1:dj].copy()
+    length, height = r1.size, r2.size
     log_power = math.log(float(power))
 
+    if subdivide:
+        known = np.zeros((length, height), dtype=np.bool_)
+        tiles_x = (length + SUBDIVISION_TILE - 1) // SUBDIVISION_TILE
+        tiles_y = (height + SUBDIVISION_TILE - 1) // SUBDIVISION_TILE
+        for tile in prange(tiles_x * tiles_y):
+            a0 = (tile // tiles_y) * SUBDIVISION_TILE
+            b0 = (tile % tiles_y) * SUBDIVISION_TILE
+            _subdivide_tile(n3, known, a0, min(a0 + SUBDIVISION_TILE, length), b0, min(b0 + SUBDIVISION_TILE, height),
+                            r1, r2, x_c, y_c, n, horizon, log_horizon, log_power, julia, burning_ship, power,
+                            radius2, tol)
+        return r1, r2, n3
+
+    masked = known.shape[0] > 0
+    for i in range(length):
+        for j in range(height):
+            if masked and known[i, j]:
+                n3[i, j] = values[i, j]
+            else:
+                n3[i, j] = _escape_value(r1[i], r2[j], x_c, y_c, n, horizon, log_horizon, log_power, julia,
+                                         burning_ship, power, radius2, tol)
+    return r1, r2, n3
+
+
+# Not cached on disk: numba only checks the cache against this file, so a change to the
+# inlined double_double functions would leave a stale kernel in use
+@njit(parallel=True)
+def _fractal_set_dd(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power, julia, burning_ship,
+                    radius2, tol, i0, i1, j0, j1, di, dj, known, values, n3):
+    """Double-double variant of `_fractal_set`."""
+    log_horizon = math.log(math.log(horizon))
+    log_power = math.log(float(power))
+    width_hi, width_lo = dd_sub(xmax, 0.0, xmin, 0.0)
+    step_x_hi, step_x_lo = dd_div_f(width_hi, width_lo, max(length - 1, 1))
+    width_hi, width_lo = dd_sub(ymax, 0.0, ymin, 0.0)
+    step_y_hi, step_y_lo = dd_div_f(width_hi, width_lo, max(height - 1, 1))
+    length, height = len(range(i0, i1, di)), len(range(j0, j1, dj))
+    r1, r1_lo = np.empty(length), np.empty(length)
+    r2, r2_lo = np.empty(height), np.empty(height)
     for i in range(length):
+        offset_hi, offset_lo = dd_mul_f(step_x_hi, step_x_lo, float(i0 + i * di))
+        r1[i], r1_lo[i] = dd_add(xmin, 0.0, offset_hi, offset_lo)
+    for j in range(height):
+        offset_hi, offset_lo = dd_mul_f(step_y_hi, step_y_lo, float(j0 + j * dj))
+        r2[j], r2_lo[j] = dd_add(ymin, 0.0, offset_hi, offset_lo)
+    masked = known.shape[0] > 0
+
+    for i in prange(length):
         for j in range(height):
-            real = r1[i]
-            imag = r2[j]
-            x_0, y_0 = init_c(real, imag, x_c, y_c)
+            if masked and known[i, j]:
+                n3[i, j] = values[i, j]
+                continue
             val = 0.0
-            for iteration in range(n):
-                if real * real + imag * imag > horizon:
-                    val = iteration + 1 - (math.log(math.log(real * real + imag * imag)) - log_horizon) / log_power
-                    break
-                real, imag = update(real, imag, x_0, y_0)
+            if not _interior_dd(r1[i], r1_lo[i], r2[j], r2_lo[j], radius2, julia, burning_ship, power):
+                re_hi, re_lo, im_hi, im_lo = r1[i], r1_lo[i], r2[j], r2_lo[j]
+                if julia:
+                    x_c_hi, x_c_lo, y_c_hi, y_c_lo = x_c, 0.0, y_c, 0.0
+                else:
+                    x_c_hi, x_c_lo, y_c_hi, y_c_lo = re_hi, re_lo, im_hi, im_lo
+                check_re_hi, check_re_lo, check_im_hi, check_im_lo = re_hi, re_lo, im_hi, im_lo
+                window, steps = 1, 0
+                for iteration in range(n):
+                    mag = re_hi * re_hi + im_hi * im_hi
+                    if mag > horizon:
+                        val = iteration + 1 - (math.log(math.log(mag)) - log_horizon) / log_power
+                        break
+                    re_hi, re_lo, im_hi, im_lo = _update_dd(re_hi, re_lo, im_hi, im_lo,
+                                                            x_c_hi, x_c_lo, y_c_hi, y_c_lo, power, burning_ship)
+                    cycle, save, window, steps = _brent_step(dd_sub(re_hi, re_lo, check_re_hi, check_re_lo)[0],
+                                                             dd_sub(im_hi, im_lo, check_im_hi, check_im_lo)[0],
+                                                             window, steps, tol)
+                    if cycle:
+                        break
+                    if save:
+                        check_re_hi, check_re_lo, check_im_hi, check_im_lo = re_hi, re_lo, im_hi, im_lo
             n3[i, j] = val
     return r1, r2, n3
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _continue_set(r1, r2, x_c, y_c, n, horizon, power, julia, burning_ship, radius2, tol, i0, i1, stride, real,
+                  imag, check_real, check_imag, count, status, value):
+    """Continues the orbits of the pixels [i0:i1:stride, ::stride] of an IterationState up to n."""
+    log_horizon = math.log(math.log(horizon))
+    log_power = math.log(float(power))
+    for k in prange((i1 - i0 + stride - 1) // stride):
+        i = i0 + k * stride
+        for j in range(0, r2.size, stride):
+            st = status[i, j]
+            if st == _ESCAPED or st == _INTERIOR or (st == _RUNNING and count[i, j] >= n):
+                continue
+            if st == _NEW:
+                if _interior(r1[i], r2[j], radius2, julia, burning_ship, power):
+                    status[i, j], value[i, j] = _INTERIOR, 0.0
+                    continue
+                re, im = r1[i], r2[j]
+                check_re, check_im = re, im
+                c = 0
+            else:
+                re, im = real[i, j], imag[i, j]
+                check_re, check_im = check_real[i, j], check_imag[i, j]
+                c = count[i, j]
+            x_0, y_0 = _init_c(r1[i], r2[j], x_c, y_c, julia)
+            window, steps = 1, c
+            while steps >= window:
+                steps -= window
+                window *= 2
+            st = _RUNNING
+            val = 0.0
+            while c < n:
+                if re * re + im * im > horizon:
+                    val = c + 1 - (math.log(math.log(re * re + im * im)) - log_horizon) / log_power
+                    st = _ESCAPED
+                    break
+                re, im = _update(re, im, x_0, y_0, burning_ship, power)
+                c += 1
+                cycle, save, window, steps = _brent_step(re - check_re, im - check_im, window, steps, tol)
+                if cycle:
+                    st = _INTERIOR
+                    break
+                if save:
+                    check_re, check_im = re, im
+            real[i, j], imag[i, j] = re, im
+            check_real[i, j], check_imag[i, j] = check_re, check_im
+            count[i, j], status[i, j], value[i, j] = c, st, val
+
+
+@lru_cache(maxsize=None)
+def _continue_kernel(julia, burning_ship, power):
+    """Entry point of `_continue_set` with the mode and power frozen in, as in `_kernel`."""
+    @njit(nogil=True, cache=True)
+    def kernel(r1, r2, x_c, y_c, n, horizon, radius2, tol, i0, i1, stride, real, imag, check_real, check_imag,
+               count, status, value):
+        _continue_set(r1, r2, x_c, y_c, n, horizon, power, julia, burning_ship, radius2, tol, i0, i1, stride, real,
+                      imag, check_real, check_imag, count, status, value)
+    return kernel
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _fractal_fields(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power, julia, burning_ship,
+                    radius2, tol, want_value, want_count, want_magnitude, want_derivative, want_interior,
+                    value, count, magnitude, derivative, interior):
+    # The float64 iteration of `_escape_value`, writing each requested field (the others
+    # are empty arrays) and carrying the derivative of the orbit only if it is requested
+    log_horizon = math.log(math.log(horizon))
+    log_power = math.log(float(power))
+    r1 = _grid(xmin, xmax, length)
+    r2 = _grid(ymin, ymax, height)
+    for i in prange(length):
+        for j in range(height):
+            real, imag = r1[i], r2[j]
+            val, c, escaped = 0.0, 0, False
+            d_real, d_imag = 1.0, 0.0  # z_0 is the pixel, both for dz/dc and dz/dz_0
+            if _interior(real, imag, radius2, julia, burning_ship, power):
+                real, imag, d_real, d_imag = 0.0, 0.0, 0.0, 0.0
+            else:
+                x_0, y_0 = _init_c(real, imag, x_c, y_c, julia)
+                check_real, check_imag = real, imag
+                window, steps = 1, 0
+                while c < n:
+                    if real * real + imag * imag > horizon:
+                        val = c + 1 - (math.log(math.log(real * real + imag * imag)) - log_horizon) / log_power
+                        escaped = True
+                        break
+                    if want_derivative:
+                        # dz' = power * w^(power - 1) * dw (+ 1 for dz/dc), where w = z, or
+                        # |Re z| + i |Im z| with dw its fold of dz for the Burning Ship
+                        w_real, w_imag = real, imag
+                        if burning_ship:
+                            w_real, w_imag = abs(real), abs(imag)
+                            d_real = d_real if real >= 0 else -d_real
+                            d_imag = d_imag if imag >= 0 else -d_imag
+                        p_real, p_imag = float(power), 0.0
+                        for _ in range(power - 1):
+                            p_real, p_imag = p_real * w_real - p_imag * w_imag, p_real * w_imag + p_imag * w_real
+                        d_real, d_imag = p_real * d_real - p_imag * d_imag, p_real * d_imag + p_imag * d_real
+                        if not julia:
+                            d_real += 1.0
+                    real, imag = _update(real, imag, x_0, y_0, burning_ship, power)
+                    c += 1
+                    cycle, save, window, steps = _brent_step(real - check_real, imag - check_imag, window, steps,
+                                                             tol)
+                    if cycle:
+                        break
+                    if save:
+                        check_real, check_imag = real, imag
+            if want_value:
+                value[i, j] = val
+            if want_count:
+                count[i, j] = c
+            if want_magnitude:
+                magnitude[i, j] = real * real + imag * imag
+            if want_derivative:
+                derivative[i, j] = math.sqrt(d_real * d_real + d_imag * d_imag)
+            if want_interior:
+                interior[i, j] = not escaped
+
+
+@lru_cache(maxsize=None)
+def _fields_kernel(julia, burning_ship, power, fields):
+    """Entry point of `_fractal_fields` with the mode, power and requested fields frozen in, as in `_kernel`."""
+    want_value, want_count, want_magnitude, want_derivative, want_interior = (name in fields for name in FIELDS)
+
+    @njit(nogil=True, cache=True)
+    def kernel(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, radius2, tol, value, count, magnitude,
+               derivative, interior):
+        _fractal_fields(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power, julia, burning_ship,
+                        radius2, tol, want_value, want_count, want_magnitude, want_derivative, want_interior,
+                        value, count, magnitude, derivative, interior)
+    return kernel
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _log_polar_set(x_centre, y_centre, rho_min, step, x_c, y_c, n_rows, horizon, power, julia, burning_ship,
+                   radius2, periodicity, n3):
+    # Row b, column a of n3 is the point at exp(rho_min + b * step) * e^(i a step) from the
+    # centre, iterated n_rows[b] times, with the cycle tolerance of the pixel size of its row
+    log_horizon = math.log(math.log(horizon))
+    log_power = math.log(float(power))
+    rows, columns = n3.shape
+    for b in prange(rows):
+        radius = math.exp(rho_min + b * step)
+        tol = PERIODICITY_TOLERANCE * radius * step if periodicity else 0.0
+        for a in range(columns):
+            n3[b, a] = _escape_value(x_centre + radius * math.cos(a * step), y_centre + radius * math.sin(a * step),
+                                     x_c, y_c, n_rows[b], horizon, log_horizon, log_power, julia, burning_ship,
+                                     power, radius2, tol)
+    return n3
+
+
+@lru_cache(maxsize=None)
+def _log_polar_kernel(julia, burning_ship, power):
+    """Entry point of `_log_polar_set` with the mode and power frozen in, as in `_kernel`."""
+    @njit(nogil=True, cache=True)
+    def kernel(x_centre, y_centre, rho_min, step, x_c, y_c, n_rows, horizon, radius2, periodicity, n3):
+        return _log_polar_set(x_centre, y_centre, rho_min, step, x_c, y_c, n_rows, horizon, power, julia,
+                              burning_ship, radius2, periodicity, n3)
+    return kernel
+
+
+def _launch(kernel, *args):
+    """Runs a compiled kernel under _KERNEL_LOCK, compiling it for the arguments outside the lock."""
+    signature = tuple(typeof(arg) for arg in args)
+    if signature not in kernel.overloads:
+        # Dispatcher.compile takes the global compiler lock of numba even if compiled
+        kernel.compile(signature)
+    with _KERNEL_LOCK:
+        return kernel(*args)
+
+
+@lru_cache(maxsize=None)
+def _kernel(precision, julia, burning_ship, power):
+    """Compiled entry point of the given precision for one mode and power."""
+    if precision == 'float64':
+        @njit(nogil=True, cache=True)
+        def kernel(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, radius2, tol, subdivide, i0, i1,
+                   j0, j1, di, dj, known, values, n3):
+            return _fractal_set(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power, julia,
+                                burning_ship, radius2, tol, subdivide, i0, i1, j0, j1, di, dj, known, values, n3)
+    else:
+        # Not cached on disk, like _fractal_set_dd. `subdivide` is always False here (see _renderer)
+        @njit(nogil=True)
+        def kernel(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, radius2, tol, subdivide, i0, i1,
+                   j0, j1, di, dj, known, values, n3):
+            return _fractal_set_dd(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power, julia,
+                                   burning_ship, radius2, tol, i0, i1, j0, j1, di, dj, known, values, n3)
+    return kernel
+
+
+def choose_precision(xmin, xmax, ymin, ymax, length, height, mode='mandelbrot'):
+    """The cheapest precision that resolves the pixels of the view."""
+    if not perturbation_required(xmin, xmax, ymin, ymax, length, height):
+        return 'float64'
+    if mode in {'mandelbrot', 'julia'}:
+        return 'perturbation'
+    return 'double_double'
+
+
+def _renderer(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power, mode, subdivide, periodicity,
+              precision):
+    """Returns a function computing the pixels [i0:i1:di, j0:j1:dj] of the grid of the view."""
+    julia, burning_ship = _mode_flags(mode, power)
+    radius2 = _central_component_radius(power) ** 2
+    tol = periodicity_tolerance(xmin, xmax, ymin, ymax, length, height) if periodicity else 0.0
+    if precision == 'auto':
+        precision = choose_precision(xmin, xmax, ymin, ymax, length, height, mode=mode)
+    if subdivide and precision != 'float64':
+        raise ValueError('Subdivision is only available in float64.')
+    if precision in {'float64', 'double_double'}:
+        kernel = _kernel(precision, julia, burning_ship, int(power))
+        args = (float(xmin), float(xmax), float(ymin), float(ymax), float(x_c), float(y_c), height, length, n,
+                float(horizon), radius2, tol, subdivide)
+
+        def render(i0, i1, j0, j1, di=1, dj=1, known=None, values=None, out=None):
+            if out is None:
+                out = np.empty((len(range(i0, i1, di)), len(range(j0, j1, dj))))
+            if known is None:
+                known, values = _NO_MASK, _NO_VALUES
+            elif subdivide:
+                raise ValueError('Subdivision cannot be combined with a mask of known pixels.')
+            else:
+                # Contiguous arrays, so that masked calls share one specialisation
+                known = np.ascontiguousarray(known, dtype=np.bool_)
+                values = np.ascontiguousarray(values, dtype=np.float64)
+            return _launch(kernel, *args, i0, i1, j0, j1, di, dj, known, values, out)
+        return render
+    elif precision == 'perturbation':
+        x_centre, y_centre = xmin + (xmax - xmin) / 2, ymin + (ymax - ymin) / 2
+        orbit, coefficients = perturbation_reference(x_centre, y_centre, xmax - xmin, ymax - ymin, x_c, y_c,
+                                                     height, length, n, horizon, power=power, mode=mode)
+        r1 = np.linspace(-abs(xmax - xmin) / 2, abs(xmax - xmin) / 2, length)
+        r2 = np.linspace(-abs(ymax - ymin) / 2, abs(ymax - ymin) / 2, height)
+
+        def render(i0, i1, j0, j1, di=1, dj=1, known=None, values=None, out=None):
+            if known is not None:
+                raise ValueError('Perturbation renders depend on the centre of the view and cannot reuse pixels.')
+            if out is None:
+                out = np.empty((len(range(i0, i1, di)), len(range(j0, j1, dj))))
+            n3 = _launch(_perturbation_set, r1[i0:i1:di], r2[j0:j1:dj], orbit, coefficients, n, horizon, power,
+                         mode == 'mandelbrot', out)
+            return r1[i0:i1:di] + x_centre, r2[j0:j1:dj] + y_centre, n3
+        return render
+    else:
+        raise ValueError('Precision must be auto, float64, double_double or perturbation.')
+
+
+def fractal_set(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power=2, mode='mandelbrot',
+                subdivide=False, periodicity=True, precision='auto', known=None, values=None, state=None,
+                return_state=False, out=None, dtype=np.float64, layout='xy'):
+    """Computes the smoothed escape iteration of every pixel of the (length, height) grid of the view."""
+    if layout not in {'xy', 'yx'}:
+        raise ValueError('Layout must be xy or yx.')
+    shape = (height, length) if layout == 'yx' else (length, height)
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif out.shape != shape:
+        raise ValueError(f'The output array must have the shape {shape}.')
+    n3 = out.T if layout == 'yx' else out  # the (length, height) view filled by the kernels
+    if state is not None or return_state:
+        if state is None:
+            state = IterationState(xmin, xmax, ymin, ymax, x_c, y_c, height, length, horizon, power=power,
+                                   mode=mode, periodicity=periodicity, precision=precision)
+        elif state.key != IterationState.make_key(xmin, xmax, ymin, ymax, x_c, y_c, height, length, horizon, power,
+                                                  mode, periodicity):
+            raise ValueError('The state belongs to another view or other parameters.')
+        if subdivide or known is not None:
+            raise ValueError('A resumable state cannot be combined with subdivision or a mask of known pixels.')
+        n3[...] = state.advance(n)
+        return (state.r1, state.r2, out, state) if return_state else (state.r1, state.r2, out)
+    render = _renderer(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power, mode, subdivide,
+                       periodicity, precision)
+    r1, r2, _ = render(0, length, 0, height, known=known, values=values, out=n3)
+    return r1, r2, out
+
+
+def fractal_fields(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power=2, mode='mandelbrot',
+                   fields=FIELDS, periodicity=True, precision='auto', layout='xy'):
+    """Computes the requested FIELDS of every pixel of the grid of `fractal_set` in one pass."""
+    fields = tuple(name for name in FIELDS if name in fields)
+    if not fields:
+        raise ValueError(f'Fields must be a non-empty subset of {FIELDS}.')
+    if layout not in {'xy', 'yx'}:
+        raise ValueError('Layout must be xy or yx.')
+    if precision == 'auto':
+        precision = choose_precision(xmin, xmax, ymin, ymax, length, height, mode=mode)
+    if precision != 'float64':
+        raise ValueError('The fields are only available in float64.')
+    julia, burning_ship = _mode_flags(mode, power)
+    radius2 = _central_component_radius(power) ** 2
+    tol = periodicity_tolerance(xmin, xmax, ymin, ymax, length, height) if periodicity else 0.0
+    shape = (height, length) if layout == 'yx' else (length, height)
+    data = np.empty(shape, dtype=np.dtype([(name, FIELD_DTYPES[name]) for name in fields], align=True))
+    view = data.T if layout == 'yx' else data  # the (length, height) view filled by the kernel
+    arrays = [view[name] if name in fields else np.empty((0, 0), dtype=FIELD_DTYPES[name]) for name in FIELDS]
+    kernel = _fields_kernel(julia, burning_ship, int(power), fields)
+    _launch(kernel, float(xmin), float(xmax), float(ymin), float(ymax), float(x_c), float(y_c), height, length, n,
+            float(horizon), radius2, tol, *arrays)
+    return _grid(float(xmin), float(xmax), length), _grid(float(ymin), float(ymax), height), data
+
+
+def log_polar_set(x_centre, y_centre, rho_min, rows, columns, x_c, y_c, n, horizon, power=2, mode='mandelbrot',
+                  periodicity=True, precision='auto', out=None):
+    """Computes the exponential map of the fractal around (x_centre, y_centre)."""
+    julia, burning_ship = _mode_flags(mode, power)
+    step = 2 * math.pi / columns
+    n_rows = np.ascontiguousarray(np.broadcast_to(np.asarray(n, dtype=np.int64), (rows,)))
+    if out is None:
+        out = np.empty((rows, columns))
+    elif out.shape != (rows, columns):
+        raise ValueError(f'The output array must have the shape {(rows, columns)}.')
+    n3 = np.asarray(out)
+    if precision == 'auto':
+        spacing = math.exp(rho_min) * step
+        required = perturbation_required(x_centre - spacing / 2, x_centre + spacing / 2, y_centre - spacing / 2,
+                                         y_centre + spacing / 2, 1, 1)
+        precision = 'perturbation' if required and mode in {'mandelbrot', 'julia'} else 'float64'
+        if required and precision == 'float64':
+            raise ValueError('The innermost rows need more than float64, which is only available for the '
+                             'Mandelbrot and Julia modes (by perturbation).')
+    if precision == 'float64':
+        kernel = _log_polar_kernel(julia, burning_ship, int(power))
+        _launch(kernel, float(x_centre), float(y_centre), float(rho_min), step, float(x_c), float(y_c), n_rows,
+                float(horizon), _central_component_radius(power) ** 2, periodicity, n3)
+    elif precision == 'perturbation':
+        spacing = math.exp(rho_min) * step
+        orbit, coefficients = perturbation_reference(x_centre, y_centre, spacing, spacing, x_c, y_c, 1, 1,
+                                                     int(n_rows.max()), horizon, power=power, mode=mode)
+        _launch(_log_polar_perturbation_set, float(rho_min), step, orbit, coefficients, n_rows, float(horizon),
+                power, mode == 'mandelbrot', n3)
+    else:
+        raise ValueError('Precision must be auto, float64 or perturbation.')
+    return out
+
+
+def _fill_bands(n3, render, i0, i1, di, j0, j1, dj, band=None, cancel=None, known=None):
+    """Computes n3[i0:i1:di, j0:j1:dj] in bands of columns; returns False if it was cancelled."""
+    step = di * band if band else max(i1 - i0, 1)
+    for start in range(i0, i1, step):
+        if cancel is not None and cancel.is_set():
+            return False
+        stop = min(start + step, i1)
+        if known is None:
+            n3[start:stop:di, j0:j1:dj] = render(start, stop, j0, j1, di, dj)[2]
+        else:
+            n3[start:stop:di, j0:j1:dj] = render(start, stop, j0, j1, di, dj, known=known[start:stop:di, j0:j1:dj],
+                                                 values=n3[start:stop:di, j0:j1:dj])[2]
+    return True
+
+
+def tile_origins(length, height, tile_size, order='centre_out'):
+    """Lists the (i0, j0) corners of the tiles covering the grid, row by row or from the centre out."""
+    origins = [(i0, j0) for j0 in range(0, height, tile_size) for i0 in range(0, length, tile_size)]
+    if order == 'centre_out':
+        def distance(origin):
+            i0, j0 = origin
+            di = (i0 + min(i0 + tile_size, length)) / 2 - length / 2
+            dj = (j0 + min(j0 + tile_size, height)) / 2 - height / 2
+            return di * di + dj * dj
+        origins.sort(key=distance)
+    elif order != 'rows':
+        raise ValueError('Order must be centre_out or rows.')
+    return origins
+
+
+def iter_tiles(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power=2, mode='mandelbrot',
+               tile_size=128, order='centre_out', subdivide=False, periodicity=True, precision='auto'):
+    """Computes the grid of `fractal_set` and yields it tile by tile as (i0, j0, n3)."""
+    render = _renderer(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power, mode, subdivide,
+                       periodicity, precision)
+    for i0, j0 in tile_origins(length, height, tile_size, order):
+        yield i0, j0, render(i0, min(i0 + tile_size, length), j0, min(j0 + tile_size, height))[2]
+
+
+def iter_refinement(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power=2, mode='mandelbrot',
+                    strides=(8, 4, 2, 1), subdivide=False, periodicity=True, precision='auto', band=None,
+                    cancel=None):
+    """Computes the grid of `fractal_set` in passes of decreasing stride, yielding (stride, n3)."""
+    render = _renderer(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power, mode, subdivide,
+                       periodicity, precision)
+    n3 = np.empty((length, height))
+    coarse = None
+    for stride in strides:
+        if coarse is None:
+            if not _fill_bands(n3, render, 0, length, stride, 0, height, stride, band, cancel):
+                return
+        else:
+            if coarse % stride:
+                raise ValueError('Each stride must divide the previous one.')
+            # The lattice of the previous pass is known, fill the rest of the finer lattice
+            # column by column: first the columns between the known ones, then the gaps
+            # inside the known columns
+            for i0 in range(stride, coarse, stride):
+                if not _fill_bands(n3, render, i0, length, coarse, 0, height, stride, band, cancel):
+                    return
+            for j0 in range(stride, coarse, stride):
+                if not _fill_bands(n3, render, 0, length, coarse, j0, height, coarse, band, cancel):
+                    return
+        coarse = stride
+        yield stride, n3 if stride == 1 else n3[::stride, ::stride].copy()
+
+
+def snap_to_pixels(view, new_view, length, height):
+    """Moves `new_view` by less than half a pixel onto a whole-pixel shift of the grid of `view`."""
+    if view is not None:
+        xmin, xmax, ymin, ymax = view
+        new_xmin, new_xmax, new_ymin, new_ymax = new_view
+        dx, dy = (xmax - xmin) / max(length - 1, 1), (ymax - ymin) / max(height - 1, 1)
+        if (dx != 0 and dy != 0 and abs((new_xmax - new_xmin) - (xmax - xmin)) <= PAN_TOLERANCE * abs(dx) and
+                abs((new_ymax - new_ymin) - (ymax - ymin)) <= PAN_TOLERANCE * abs(dy)):
+            si, sj = round((new_xmin - xmin) / dx), round((new_ymin - ymin) / dy)
+            shifted = xmin + si * dx, xmax + si * dx, ymin + sj * dy, ymax + sj * dy
+            if exact_grid(shifted[0], shifted[1], length) and exact_grid(shifted[2], shifted[3], height):
+                return shifted
+    return exact_view(*new_view, length, height)
+
+
+def pixel_shift(view, new_view, length, height):
+    """Returns the shift (si, sj) in whole pixels from the grid of `view` to that of `new_view`, or None."""
+    xmin, xmax, ymin, ymax = view
+    new_xmin, new_xmax, new_ymin, new_ymax = new_view
+    dx, dy = (xmax - xmin) / max(length - 1, 1), (ymax - ymin) / max(height - 1, 1)
+    if dx == 0 or dy == 0:
+        return None
+    if not all(exact_grid(vmin, vmax, count) for vmin, vmax, count in
+               ((xmin, xmax, length), (ymin, ymax, height), (new_xmin, new_xmax, length),
+                (new_ymin, new_ymax, height))):
+        return None
+    si, sj = round((new_xmin - xmin) / dx), round((new_ymin - ymin) / dy)
+    for offset, shift in (((new_xmin - xmin) / dx, si), ((new_xmax - xmax) / dx, si),
+                          ((new_ymin - ymin) / dy, sj), ((new_ymax - ymax) / dy, sj)):
+        if abs(offset - shift) > PAN_TOLERANCE:
+            return None
+    return si, sj
+
+
+def pan_field(n3, si, sj, xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power=2,
+              mode='mandelbrot', periodicity=True, precision='auto', band=None, cancel=None):
+    """Computes the grid of the view from that of the view moved by (si, sj) pixels; None if cancelled."""
+    if precision == 'auto':
+        precision = choose_precision(xmin, xmax, ymin, ymax, length, height, mode=mode)
+    if precision == 'perturbation':
+        raise ValueError('Perturbation renders depend on the centre of the view and cannot be shifted.')
+    render = _renderer(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power, mode, False,
+                       periodicity, precision)
+    field = np.empty((length, height))
+    # Pixels of the new grid that are also in n3
+    i0, i1 = max(-si, 0), min(length - si, length)
+    j0, j1 = max(-sj, 0), min(height - sj, height)
+    if i0 < i1 and j0 < j1:
+        field[i0:i1, j0:j1] = n3[i0 + si:i1 + si, j0 + sj:j1 + sj]
+        strips = ((0, i0, 0, height), (i1, length, 0, height), (i0, i1, 0, j0), (i0, i1, j1, height))
+    else:
+        strips = ((0, length, 0, height),)
+    for a0, a1, b0, b1 in strips:
+        if a0 < a1 and b0 < b1 and not _fill_bands(field, render, a0, a1, 1, b0, b1, 1, band, cancel):
+            return None
+    return field
+
+
+def _exact_axis(vmin, vmax, count):
+    # (vmin, step) of an exact grid (see `exact_grid`) within a small fraction of a pixel of
+    # the axis: the axis itself if it is one, otherwise a spacing with ALIGNED_GRID_BITS
+    # significant bits and an origin on its lowest bit
+    div = max(count - 1, 1)
+    if exact_grid(vmin, vmax, count):
+        return vmin, (vmax - vmin) / div
+    mantissa, exponent = math.frexp((vmax - vmin) / div)
+    quantum = math.ldexp(1.0, exponent - ALIGNED_GRID_BITS)
+    return round(vmin / quantum) * quantum, round(mantissa * 2 ** ALIGNED_GRID_BITS) * quantum
+
+
+def exact_view(xmin, xmax, ymin, ymax, length, height):
+    """Moves the view by a fraction of a pixel onto a grid whose coordinates are all float64 numbers."""
+    view = []
+    for vmin, vmax, count in ((xmin, xmax, length), (ymin, ymax, height)):
+        new_vmin, step = _exact_axis(vmin, vmax, count)
+        new_vmax = new_vmin + max(count - 1, 1) * step
+        view += [new_vmin, new_vmax] if exact_grid(new_vmin, new_vmax, count) else [vmin, vmax]
+    return tuple(view)
+
+
+def aligned_zoom(xmin, xmax, ymin, ymax, length, height, scale):
+    """Zooms the view by `scale` around its centre, keeping the new grid aligned with the old one."""
+    if scale not in {2, 0.5}:
+        raise ValueError('Scale must be 2 or 0.5.')
+    view = []
+    for vmin, vmax, count in ((xmin, xmax, length), (ymin, ymax, height)):
+        div = max(count - 1, 1)
+        vmin, step = _exact_axis(vmin, vmax, count)
+        # Keep the centre within a pixel of the old one: the offset is in old pixels when
+        # zooming in and in new pixels when zooming out
+        offset = round(div / 4)
+        if scale == 2:
+            vmin, step = vmin + offset * step, step / 2
+        else:
+            vmin, step = vmin - offset * 2 * step, step * 2
+        view += [vmin, vmin + div * step]
+    return tuple(view)
+
+
+def exact_grid(vmin, vmax, count):
+    """Checks whether every point of a grid axis is a float64 number."""
+    vmin, vmax = Fraction(float(vmin)), Fraction(float(vmax))
+    step = (vmax - vmin) / max(count - 1, 1)
+    denominator = max(step.denominator, vmin.denominator)
+    if denominator & (denominator - 1):  # Not a power of two
+        return False
+    return max(abs(vmin), abs(vmax), abs(vmax - vmin)) * denominator < 2 ** 53
+
+
+def shared_pixels(view, new_view, length, height):
+    """Returns the indices (ki, kj) of the pixels of `view` that the grid of `new_view` shares, or None."""
+    indices = []
+    for vmin, vmax, new_vmin, new_vmax, count in ((view[0], view[1], new_view[0], new_view[1], length),
+                                                  (view[2], view[3], new_view[2], new_view[3], height)):
+        if not (exact_grid(vmin, vmax, count) and exact_grid(new_vmin, new_vmax, count)):
+            return None
+        vmin, vmax = Fraction(float(vmin)), Fraction(float(vmax))
+        new_vmin, new_vmax = Fraction(float(new_vmin)), Fraction(float(new_vmax))
+        if vmax == vmin:
+            return None
+        # Old index of new pixel i: offset + i * ratio
+        div = max(count - 1, 1)
+        offset = (new_vmin - vmin) * div / (vmax - vmin)
+        ratio = (new_vmax - new_vmin) / (vmax - vmin)
+        index = np.full(count, -1, dtype=np.int64)
+        for i in range(count):
+            k = offset + i * ratio
+            if k.denominator == 1 and 0 <= k < count:
+                index[i] = k.numerator
+        indices.append(index)
+    return tuple(indices)
+
+
+def fill_field(field, known, xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power=2,
+               mode='mandelbrot', periodicity=True, precision='auto', band=None, cancel=None):
+    """Computes the pixels of `field` not marked in `known`, in place; None if cancelled."""
+    if precision == 'auto':
+        precision = choose_precision(xmin, xmax, ymin, ymax, length, height, mode=mode)
+    render = _renderer(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power, mode, False,
+                       periodicity, precision)
+    if not _fill_bands(field, render, 0, length, 1, 0, height, 1, band, cancel, known):
+        return None
+    return field
+
+
+def reuse_field(n3, ki, kj, xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power=2,
+                mode='mandelbrot', periodicity=True, precision='auto', band=None, cancel=None):
+    """Computes the grid of the view, taking the pixels it shares with a previous render from it."""
+    known = (ki >= 0)[:, None] & (kj >= 0)[None, :]
+    field = np.zeros((length, height))
+    field[known] = n3[np.ix_(np.maximum(ki, 0), np.maximum(kj, 0))][known]
+    return fill_field(field, known, xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power=power,
+                      mode=mode, periodicity=periodicity, precision=precision, band=band, cancel=cancel)
+
+
+def edge_pixels(image, tolerance):
+    """Marks the pixels of `image` that differ from one of their 8 neighbours by more than `tolerance`."""
+    length, height = image.shape
+    padded = np.pad(image, 1, mode='edge')
+    edges = np.zeros(image.shape, dtype=np.bool_)
+    for a in range(3):
+        for b in range(3):
+            edges |= np.abs(padded[a:a + length, b:b + height] - image) > tolerance
+    return edges
+
+
+def adaptive_supersample(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, supersampling, power=2,
+                         mode='mandelbrot', periodicity=True, precision='auto', transform=None,
+                         tolerance=EDGE_TOLERANCE, band=None):
+    """Computes the image of the view supersampled where it aliases, in bands of columns."""
+    ss = supersampling
+    fine_length, fine_height = length * ss, height * ss
+    if precision == 'auto':
+        precision = choose_precision(xmin, xmax, ymin, ymax, fine_length, fine_height, mode=mode)
+    render = _renderer(xmin, xmax, ymin, ymax, x_c, y_c, fine_height, fine_length, n, horizon, power, mode, False,
+                       periodicity, precision)
+    # The pixel centres span the view shrunk by (ss - 1) / 2 subpixels on each side
+    dx = (ss - 1) / 2 * (xmax - xmin) / max(fine_length - 1, 1)
+    dy = (ss - 1) / 2 * (ymax - ymin) / max(fine_height - 1, 1)
+    image = _renderer(xmin + dx, xmax - dx, ymin + dy, ymax - dy, x_c, y_c, height, length, n, horizon, power, mode,
+                      False, periodicity, precision)(0, length, 0, height)[2]
+    if transform is not None:
+        image = transform(image)
+    if ss == 1:
+        return image
+    edges = edge_pixels(image, tolerance * (image.max() - image.min()))
+    if band is None:
+        band = max(SUPERSAMPLING_BAND_MEMORY // (ss * fine_height * image.itemsize), 1)
+    # Values of the pixels outside the edge blocks, which are never used
+    unused = np.zeros((min(band, length) * ss, fine_height))
+    for i0 in range(0, length, band):
+        i1 = min(i0 + band, length)
+        band_edges = edges[i0:i1]
+        if not band_edges.any():
+            continue
+        if precision == 'perturbation':
+            fine = render(i0 * ss, i1 * ss, 0, fine_height)[2]
+        else:
+            known = ~np.repeat(np.repeat(band_edges, ss, axis=0), ss, axis=1)
+            fine = render(i0 * ss, i1 * ss, 0, fine_height, known=known, values=unused[:(i1 - i0) * ss])[2]
+        if transform is not None:
+            fine = transform(fine)
+        blocks = fine.reshape((i1 - i0, ss, height, ss)).mean(axis=(1, 3))
+        image[i0:i1][band_edges] = blocks[band_edges]
+    return image
+
+
+class IterationState:
+    """Per-pixel progress of a float64 render that `fractal_set` can resume."""
+
+    def __init__(self, xmin, xmax, ymin, ymax, x_c, y_c, height, length, horizon, power=2, mode='mandelbrot',
+                 periodicity=True, precision='auto'):
+        if precision == 'auto':
+            precision = choose_precision(xmin, xmax, ymin, ymax, length, height, mode=mode)
+        if precision != 'float64':
+            raise ValueError('A resumable state is only available in float64.')
+        julia, burning_ship = _mode_flags(mode, power)
+        self.key = self.make_key(xmin, xmax, ymin, ymax, x_c, y_c, height, length, horizon, power, mode,
+                                 periodicity)
+        self.n = 0  # Every pixel is iterated at least this far
+        self.r1, self.r2 = _grid(float(xmin), float(xmax), length), _grid(float(ymin), float(ymax), height)
+        self.real, self.imag = np.zeros((length, height)), np.zeros((length, height))
+        self.check_real, self.check_imag = np.zeros((length, height)), np.zeros((length, height))
+        self.count = np.zeros((length, height), dtype=np.int64)
+        self.status = np.full((length, height), _NEW, dtype=np.int8)
+        self.value = np.zeros((length, height))
+        self._kernel = _continue_kernel(julia, burning_ship, int(power))
+        self._args = (float(x_c), float(y_c))
+        self._radius2 = _central_component_radius(power) ** 2
+        self._horizon = float(horizon)
+        self._tol = periodicity_tolerance(xmin, xmax, ymin, ymax, length, height) if periodicity else 0.0
+
+    @staticmethod
+    def make_key(xmin, xmax, ymin, ymax, x_c, y_c, height, length, horizon, power, mode, periodicity):
+        """Everything but n that the state depends on."""
+        return (float(xmin), float(xmax), float(ymin), float(ymax), float(x_c), float(y_c), height, length,
+                float(horizon), int(power), mode, periodicity)
+
+    def advance(self, n, band=None, cancel=None, stride=1):
+        """Returns the grid of `fractal_set` with n iterations, iterating further the pixels still running."""
+        if n > self.n:
+            length = self.r1.size
+            step = stride * band if band else length
+            for start in range(0, length, step):
+                if cancel is not None and cancel.is_set():
+                    return None
+                _launch(self._kernel, self.r1, self.r2, *self._args, n, self._horizon, self._radius2, self._tol,
+                        start, min(start + step, length), stride, self.real, self.imag, self.check_real,
+                        self.check_imag, self.count, self.status, self.value)
+            if stride == 1:
+                self.n = n
+        status, count = self.status[::stride, ::stride], self.count[::stride, ::stride]
+        return np.where((status == _ESCAPED) & (count < n), self.value[::stride, ::stride], 0.0)
+
+
+def warm_up(modes=('mandelbrot', 'julia', 'burning_ship', 'burning_ship_julia'), powers=range(2, 9),
+            precisions=('float64', 'double_double', 'perturbation'), layouts=('xy',)):
+    """Compiles the kernels for the given modes, powers, precisions and layouts by rendering a tiny view."""
+    for mode in modes:
+        for power in powers:
+            for precision in precisions:
+                if precision == 'perturbation' and mode not in {'mandelbrot', 'julia'}:
+                    continue
+                for layout in layouts:
+                    fractal_set(-1.0, 1.0, -1.0, 1.0, 0.0, 0.0, 2, 2, 1, 4.0, power=power, mode=mode,
+                                precision=precision, layout=layout)
+                if precision == 'float64':
+                    # The resumable variant, used when only N changes
+                    fractal_set(-1.0, 1.0, -1.0, 1.0, 0.0, 0.0, 2, 2, 1, 4.0, power=power, mode=mode,
+                                precision=precision, return_state=True)
+
+
+def warm_up_cache(modes, powers, precisions, layouts=('xy',)):
+    """Runs `warm_up` in a child process, which fills the disk cache without starting numba threads here."""
+    # A process that ran a parallel kernel and then forks a pool hangs at exit. The
+    # double-double kernel is not cached on disk, so compiling it here would be lost
+    precisions = tuple(precision for precision in precisions if precision != 'double_double')
+    process = mp.Process(target=warm_up, args=(modes, powers, precisions, layouts))
+    process.start()
+    process.join()
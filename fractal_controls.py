@@ -1,12 +1,19 @@
 import math
+import threading
+import time
+import traceback
 
 import numpy as np
-from PySide6.QtCore import QSize
-from matplotlib import colors
-from matplotlib import pyplot as plt
+from PySide6.QtCore import QObject, QSize, Signal
 
+from colouring import colour_lut, shade_image
 from config import *
-from fractal_calculation import fractal_set
+from fractal_calculation import (IterationState, aligned_zoom, choose_precision,
+                                 fill_field, iter_refinement, pan_field,
+                                 pixel_shift, reuse_field, shared_pixels,
+                                 snap_to_pixels)
+from tile_cache import TileCache
+from tile_store import TileStore
 from ui_form_setC import Ui_setC
 from ui_form_setLimits import Ui_setLimits
 
@@ -59,6 +66,129 @@ class DialogSetLimits(BaseDialog):
         ui.pushButton_SetC.clicked.connect(lambda: parent.set_limits('centre'))
 
 
+class RenderWorker(QObject):
+    """Renders the newest request in a background thread, reusing earlier results where it can."""
+    pass_ready = Signal(int, int, object)
+    VIEW_KEYS = ('xmin', 'xmax', 'ymin', 'ymax')
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._condition = threading.Condition()
+        self._request = None
+        self._cancel = threading.Event()
+        self._field = None  # (kwargs, n3) of the last finished render
+        self._state = None  # IterationState of the last float64 render made in passes
+        self.tile_cache = TileCache(max_bytes=TILE_CACHE_MEMORY, tile_size=TILE_CACHE_SIZE)
+        self.tile_store = TileStore(TILE_STORE_DIR, max_bytes=TILE_STORE_DISK)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, request_id, keep=True, **kwargs):
+        with self._condition:
+            self._request = request_id, keep, kwargs
+            self._cancel.set()
+            self._condition.notify()
+
+    def store_last(self):
+        """Writes the last finished render to the tile store, so that its view reopens without computing."""
+        if self._field is not None:
+            kwargs, n3 = self._field
+            self.tile_store.save(n3, **{key: value for key, value in kwargs.items() if key != 'strides'})
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._request is None:
+                    self._condition.wait()
+                request_id, keep, kwargs = self._request
+                self._request = None
+                self._cancel.clear()
+            try:
+                self._render(request_id, kwargs, keep)
+            except Exception:
+                traceback.print_exc()
+
+    def _render(self, request_id, kwargs, keep=True):
+        result = self._reuse(kwargs, keep)
+        if result is None and keep and kwargs['precision'] == 'float64':
+            result = self._refine_state(request_id, kwargs)
+        elif result is None:
+            for stride, data in iter_refinement(**kwargs, band=RENDER_BAND, cancel=self._cancel):
+                if stride > 1:
+                    self.pass_ready.emit(request_id, stride, data)
+                else:
+                    result = kwargs, data
+        if result:
+            if keep:
+                self._field = result
+                self.tile_cache.store(*result)
+            self.pass_ready.emit(request_id, 1, result[1])
+
+    def _reuse(self, kwargs, keep=True):
+        """Renders the request from earlier results; None if nothing can be reused, False if cancelled."""
+        if keep:  # previews are never stored, so they are not looked up on the disk either
+            field = self.tile_store.load(**{key: value for key, value in kwargs.items() if key != 'strides'})
+            if field is not None:
+                return kwargs, field
+        field, known = self.tile_cache.lookup(kwargs)
+        if known.all():
+            return kwargs, field
+        for reuse in (self._resume, self._reuse_last):
+            result = reuse(kwargs)
+            if result is not None:
+                return result
+        if known.any() and kwargs['precision'] != 'perturbation':
+            render_kwargs = {key: value for key, value in kwargs.items() if key != 'strides'}
+            data = fill_field(field, known, **render_kwargs, band=RENDER_BAND, cancel=self._cancel)
+            return False if data is None else (kwargs, data)
+        return None
+
+    @staticmethod
+    def _state_kwargs(kwargs):
+        return {key: kwargs[key] for key in ('xmin', 'xmax', 'ymin', 'ymax', 'x_c', 'y_c', 'height', 'length',
+                                             'horizon', 'power', 'mode')}
+
+    def _refine_state(self, request_id, kwargs):
+        """Renders a float64 request in passes through an IterationState, which is kept."""
+        state = IterationState(**self._state_kwargs(kwargs), precision='float64')
+        for stride in kwargs['strides']:
+            data = state.advance(kwargs['n'], band=RENDER_BAND, cancel=self._cancel, stride=stride)
+            if data is None:
+                return False
+            if stride > 1:
+                self.pass_ready.emit(request_id, stride, data)
+        self._state = state
+        return kwargs, data
+
+    def _resume(self, kwargs):
+        """Renders the request from the kept IterationState of its view, if there is one."""
+        if kwargs['precision'] != 'float64':
+            return None
+        if self._state is None or self._state.key != IterationState.make_key(**self._state_kwargs(kwargs),
+                                                                             periodicity=True):
+            return None  # rendered in progressive passes instead, which keep a new state
+        data = self._state.advance(kwargs['n'], band=RENDER_BAND, cancel=self._cancel)
+        return False if data is None else (kwargs, data)
+
+    def _reuse_last(self, kwargs):
+        """Renders the request from the last finished render, if it can be reused."""
+        if self._field is None or kwargs['precision'] == 'perturbation':
+            return None
+        previous, n3 = self._field
+        if any(previous[key] != value for key, value in kwargs.items() if key not in self.VIEW_KEYS):
+            return None
+        view, new_view = [previous[key] for key in self.VIEW_KEYS], [kwargs[key] for key in self.VIEW_KEYS]
+        render_kwargs = {key: value for key, value in kwargs.items() if key != 'strides'}
+        shift = pixel_shift(view, new_view, kwargs['length'], kwargs['height'])
+        if shift is not None:
+            data = pan_field(n3, *shift, **render_kwargs, band=RENDER_BAND, cancel=self._cancel)
+            return False if data is None else (kwargs, data)
+        indices = shared_pixels(view, new_view, kwargs['length'], kwargs['height'])
+        if indices is None or (indices[0] < 0).all() or (indices[1] < 0).all():
+            return None
+        data = reuse_field(n3, *indices, **render_kwargs, band=RENDER_BAND, cancel=self._cancel)
+        return False if data is None else (kwargs, data)
+
+
 class FractalControls:
     def ax_update(self, event=None):
         """
@@ -67,12 +197,25 @@ class FractalControls:
         selected mode and current settings.
         """
         n = self.n
+        length, height = self.length, self.height
+        if self.c_preview:
+            # A C slider is being dragged: render fewer pixels and iterations, see adapt_preview
+            length = max(1, round(length / self.preview_scale))
+            height = max(1, round(height / self.preview_scale))
+            n = max(1, int(n * PREVIEW_N_FRACTION))
         if self.horizon < 4:
             self.horizon = 4
             self.ui.lineEdit_H.setText('4')
         self.ax.set_autoscale_on(False)  # Otherwise, infinite loop
-        im = self.ax.images[0]
         xmin, xmax, ymin, ymax = np.float64([*self.ax.get_xlim(), *self.ax.get_ylim()])
+        # Every view is rendered on an exact grid, and Pan/Move, which shifts the view by
+        # fractions of a pixel, is snapped to whole pixels of the previous view, so that the
+        # worker only computes the newly exposed strips, with the values of a full render
+        view = snap_to_pixels(self.render_extent, (xmin, xmax, ymin, ymax), self.length, self.height)
+        if view != (xmin, xmax, ymin, ymax):
+            xmin, xmax, ymin, ymax = np.float64(view)
+            self.ax.set_xlim(xmin, xmax, emit=False)
+            self.ax.set_ylim(ymin, ymax, emit=False)
         print('lims =', xmin, xmax, ymin, ymax)
         # Update limits in GUI
         self.ui.label_limX.setText(f'({xmin:.16f},\n {xmax:.16f})')
@@ -82,27 +225,53 @@ class FractalControls:
             print('x_c, y_c =', self.x_c, self.y_c)
         print('n, diff =', n, xmax - xmin, ymax - ymin)
         print(xmin, xmax, ymin, ymax, n, self.horizon, self.length, self.height)
-        # Transpose data for correct synchronisation with imshow
-        data = fractal_set(xmin, xmax, ymin, ymax, horizon=self.horizon,
-                           length=self.length, height=self.height, n=n,
-                           x_c=self.x_c, y_c=self.y_c, power=self.power, mode=self.mode)[2].T
+        precision = choose_precision(xmin, xmax, ymin, ymax, length, height, mode=self.mode)
+        print('precision =', precision)
+        cache = self.render_worker.tile_cache
+        print('tile cache hits, misses, evictions =', cache.hits, cache.misses, cache.evictions)
         if self.mode in {'burning_ship', 'burning_ship_julia'} and not self.ax.yaxis_inverted():
             self.ax.invert_yaxis()
         if self.mode in {'mandelbrot', 'julia'} and self.ax.yaxis_inverted():
             self.ax.invert_yaxis()
+        # Progressive rendering in the worker: every pass refines the previous one, reusing
+        # its pixels, and is shown by show_render_pass. A newer request supersedes this one
+        self.render_id += 1
+        self.render_extent = (xmin, xmax, ymin, ymax)
+        if self.c_preview:
+            self.preview_id, self.preview_start = self.render_id, time.perf_counter()
+        self.render_worker.submit(self.render_id, keep=not self.c_preview, xmin=xmin, xmax=xmax, ymin=ymin,
+                                  ymax=ymax, horizon=self.horizon, length=length, height=height, n=n, x_c=self.x_c,
+                                  y_c=self.y_c, power=self.power, mode=self.mode,
+                                  strides=(1,) if self.c_preview else PROGRESSIVE_STRIDES, precision=precision)
+
+    def show_render_pass(self, request_id, stride, data):
+        """Shows a pass of the render started by ax_update, unless a newer one was started since."""
+        if request_id != self.render_id:
+            return
+        im = self.ax.images[0]
+        xmin, xmax, ymin, ymax = self.render_extent
+        # Transpose data for correct synchronisation with imshow
+        data = data.T
         if self.regime == 'sin':
             self.cache = data
             data = (np.sin(data * self.freq + self.offset)) ** 2
         if not self.shading:
             im.set(data=data, extent=(xmin, xmax, ymin, ymax), cmap=self.colourmap)
         else:
-            light = colors.LightSource(azdeg=self.azdeg, altdeg=self.altdeg)
-            data = light.shade(data, cmap=plt.get_cmap(self.colourmap), vert_exag=self.vert_exag,
-                               blend_mode='hsv')
+            data = shade_image(data, colour_lut(self.colourmap, bytes=False), self.azdeg, self.altdeg,
+                               self.vert_exag, origin='upper')
             im.set(data=data, extent=(xmin, xmax, ymin, ymax))
         im.set(clim=(im.get_array().min(), im.get_array().max()))
         self.fig.canvas.draw_idle()  # better than draw()
-        self.fig.tight_layout()
+        if stride == 1:
+            self.fig.tight_layout()
+        if request_id == self.preview_id:
+            self.adapt_preview(time.perf_counter() - self.preview_start)
+
+    def adapt_preview(self, frame_time):
+        """Rescales the C slider previews so that they take PREVIEW_FRAME_TIME."""
+        scale = self.preview_scale * math.sqrt(frame_time / PREVIEW_FRAME_TIME)
+        self.preview_scale = min(max(scale, 1.0), PREVIEW_MAX_SCALE)
 
     @property
     def n(self):
@@ -189,6 +358,8 @@ class JuliaParameterControl:
     def set_c_from_slider(self, value):
         if self.invalid_slider:
             return
+        # While the slider is dragged, render reduced-resolution previews (see ax_update)
+        self.c_preview = self.sender().isSliderDown()
         if self.c_view == 'xy':
             if self.sender() == self.ui.horizontalSlider_XC:
                 self.x_c = -1 + self.delta_slider_xc * value
@@ -207,6 +378,13 @@ class JuliaParameterControl:
             self.set_c_from_values(self.rho_c, self.phi_c, 'rhophi')
         else:
             raise ValueError('Invalid c_view.')
+        self.c_preview = False
+
+    def finish_c_preview(self):
+        """Renders the final C of a dragged slider in full quality."""
+        self.c_preview = False
+        if not self.no_ax_update:
+            self.ax_update()
 
     def change_c_view(self):
         c_view_old = self.c_view
@@ -448,10 +626,8 @@ class CoordinateManager:
             scale = 0.5
         else:
             raise ValueError('Invalid regime.')
-        xmin_new = (xmin + xmax) / 2 - (xmax - xmin) / (2 * scale)
-        xmax_new = (xmin + xmax) / 2 + (xmax - xmin) / (2 * scale)
-        ymin_new = (ymin + ymax) / 2 - (ymax - ymin) / (2 * scale)
-        ymax_new = (ymin + ymax) / 2 + (ymax - ymin) / (2 * scale)
+        # The new grid is aligned with the old one, so that a quarter of its pixels are reused
+        xmin_new, xmax_new, ymin_new, ymax_new = aligned_zoom(xmin, xmax, ymin, ymax, self.length, self.height, scale)
         self.ax.set_xlim(xmin_new, xmax_new)
         self.ax.set_ylim(ymin_new, ymax_new)
 
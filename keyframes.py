@@ -0,0 +1,88 @@
+import math
+
+from numba import njit, prange
+
+
+def interpolate_view(scale, view_1, view_2):
+    """The view of `make_frame` at the given scale: the bounds move linearly from view_1 to view_2."""
+    return tuple((1 - scale) * bound_1 + scale * bound_2 for bound_1, bound_2 in zip(view_1, view_2))
+
+
+def _scale_of_width(width, view_1, view_2):
+    # Inverse of interpolate_view along the width of the views, clipped to the animation
+    width_1, width_2 = view_1[1] - view_1[0], view_2[1] - view_2[0]
+    return min(max((width_1 - width) / (width_1 - width_2), 0.0), 1.0)
+
+
+def keyframe_level(view, view_1):
+    """Index k of the keyframe covering the view, the one of the widths in [w_1 / 2^(k+1), w_1 / 2^k]."""
+    return max(int(math.floor(math.log2((view_1[1] - view_1[0]) / (view[1] - view[0])))), 0)
+
+
+def keyframe_view(k, view_1, view_2, length, height, oversampling=1):
+    """Returns (xmin, xmax, ymin, ymax, length, height, width) of keyframe k."""
+    width_1, width_2 = view_1[1] - view_1[0], view_2[1] - view_2[0]
+    wide = interpolate_view(_scale_of_width(width_1 / 2 ** k, view_1, view_2), view_1, view_2)
+    narrow = interpolate_view(_scale_of_width(width_1 / 2 ** (k + 1), view_1, view_2), view_1, view_2)
+    dx = (narrow[1] - narrow[0]) / (length - 1) / oversampling
+    dy = (narrow[3] - narrow[2]) / (height - 1) / oversampling
+    bounds = []
+    counts = []
+    for vmin, vmax, step in ((min(wide[0], narrow[0]), max(wide[1], narrow[1]), dx),
+                             (min(wide[2], narrow[2]), max(wide[3], narrow[3]), dy)):
+        count = int(math.ceil((vmax - vmin) / step)) + 1
+        pad = ((count - 1) * step - (vmax - vmin)) / 2  # Centres the whole number of pixels on the box
+        bounds += [vmin - pad, vmax + pad]
+        counts.append(count)
+    return (*bounds, *counts, max(width_1 / 2 ** (k + 1), width_2))
+
+
+@njit(fastmath=True, inline='always')
+def _box_average(field, u0, u1, v0, v1):
+    # Mean of the field over [u0, u1] x [v0, v1] in pixel units, pixel (row, column) being the
+    # square of side 1 around (v, u) = (row, column)
+    rows, columns = field.shape
+    u0, u1 = max(u0, -0.5), min(u1, columns - 0.5)
+    v0, v1 = max(v0, -0.5), min(v1, rows - 0.5)
+    total, weight = 0.0, 0.0
+    for row in range(max(int(math.floor(v0 + 0.5)), 0), min(int(math.ceil(v1 + 0.5)), rows)):
+        w_row = min(v1, row + 0.5) - max(v0, row - 0.5)
+        if w_row <= 0:
+            continue
+        for column in range(max(int(math.floor(u0 + 0.5)), 0), min(int(math.ceil(u1 + 0.5)), columns)):
+            w = w_row * (min(u1, column + 0.5) - max(u0, column - 0.5))
+            if w > 0:
+                total += w * field[row, column]
+                weight += w
+    return total / weight if weight > 0 else 0.0
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _composite(coarse, c_x0, c_dx, c_y0, c_dy, fine, f_x0, f_dx, f_y0, f_dy, x0, dx, y0, dy, out):
+    height, length = out.shape
+    f_rows, f_columns = fine.shape
+    for y in prange(height):
+        y_lo, y_hi = y0 + (y - 0.5) * dy, y0 + (y + 0.5) * dy
+        for x in range(length):
+            x_lo, x_hi = x0 + (x - 0.5) * dx, x0 + (x + 0.5) * dx
+            u0, u1 = (x_lo - f_x0) / f_dx, (x_hi - f_x0) / f_dx
+            v0, v1 = (y_lo - f_y0) / f_dy, (y_hi - f_y0) / f_dy
+            if u0 >= -0.5 and u1 <= f_columns - 0.5 and v0 >= -0.5 and v1 <= f_rows - 0.5:
+                out[y, x] = _box_average(fine, u0, u1, v0, v1)
+            else:
+                out[y, x] = _box_average(coarse, (x_lo - c_x0) / c_dx, (x_hi - c_x0) / c_dx,
+                                         (y_lo - c_y0) / c_dy, (y_hi - c_y0) / c_dy)
+    return out
+
+
+def _grid_origin(view, shape):
+    # First coordinate and spacing of the np.linspace grids of the view along x and y
+    xmin, xmax, ymin, ymax = view
+    height, length = shape
+    return xmin, (xmax - xmin) / max(length - 1, 1), ymin, (ymax - ymin) / max(height - 1, 1)
+
+
+def composite_keyframes(coarse, coarse_view, fine, fine_view, view, out):
+    """Fills `out`, indexed [y, x], with the area average of the two keyframes under its pixels."""
+    return _composite(coarse, *_grid_origin(coarse_view, coarse.shape), fine, *_grid_origin(fine_view, fine.shape),
+                      *_grid_origin(view, out.shape), out)
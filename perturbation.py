@@ -0,0 +1,139 @@
+import math
+from decimal import Decimal, localcontext
+
+import numpy as np
+from numba import njit, prange
+
+# Plain float64 iteration is replaced by perturbation once the pixel spacing
+# drops below this fraction of the coordinate magnitude (~1e4 float64 ulps).
+PERTURBATION_RELATIVE_SPACING = 1e4 * np.finfo(np.float64).eps
+
+
+def perturbation_required(xmin, xmax, ymin, ymax, length, height):
+    """Check whether the pixel spacing is too fine for plain float64 iteration."""
+    spacing = min(abs(xmax - xmin) / max(length - 1, 1), abs(ymax - ymin) / max(height - 1, 1))
+    scale = max(abs(xmin), abs(xmax), abs(ymin), abs(ymax), 1.0)
+    return spacing < PERTURBATION_RELATIVE_SPACING * scale
+
+
+def reference_orbit(x_ref, y_ref, x_c, y_c, n, horizon, power=2, mode='mandelbrot', digits=30):
+    """Iterates the reference point with `digits` decimal digits and returns its orbit as complex128."""
+    with localcontext() as ctx:
+        ctx.prec = digits
+        if mode == 'mandelbrot':
+            real, imag = Decimal(0), Decimal(0)
+            c_real, c_imag = Decimal(x_ref), Decimal(y_ref)
+        elif mode == 'julia':
+            real, imag = Decimal(x_ref), Decimal(y_ref)
+            c_real, c_imag = Decimal(x_c), Decimal(y_c)
+        else:
+            raise ValueError('Perturbation is only available for mandelbrot and julia modes.')
+        orbit = [complex(float(real), float(imag))]
+        for _ in range(n + 1):
+            real_p, imag_p = real, imag
+            for _ in range(power - 1):
+                real_p, imag_p = real_p * real - imag_p * imag, real_p * imag + imag_p * real
+            real, imag = real_p + c_real, imag_p + c_imag
+            orbit.append(complex(float(real), float(imag)))
+            if orbit[-1].real ** 2 + orbit[-1].imag ** 2 > horizon:
+                break
+    return np.array(orbit, dtype=np.complex128)
+
+
+def _binomial_coefficients(orbit, power):
+    """Coefficients C(power, j) * Z^(power - j) of the expansion of (Z + dz)^power - Z^power."""
+    j = np.arange(power)
+    binomial = np.array([math.comb(power, k) for k in j], dtype=np.float64)
+    coefficients = binomial[None, :] * orbit[:, None] ** (power - j)[None, :]
+    coefficients[:, 0] = 0.0  # j = 0 term cancels
+    return coefficients
+
+
+@njit(fastmath=True, inline='always')
+def _perturbation_value(delta, orbit, coefficients, n, horizon, log_horizon, log_power, power, mandelbrot):
+    # Smoothed escape iteration of the pixel at `delta` from the reference point.
+    # Mandelbrot pixels start from z = c, i.e. one step ahead of the z0 = 0 reference
+    last = orbit.size - 1
+    if mandelbrot:
+        dc = delta
+        dz = dc
+        k = 1
+    else:
+        dc = 0j
+        dz = delta
+        k = 0
+    for iteration in range(n):
+        z = orbit[k] + dz
+        mag = z.real * z.real + z.imag * z.imag
+        if mag > horizon:
+            return iteration + 1 - (math.log(math.log(mag)) - log_horizon) / log_power
+        # Rebase onto the start of the reference orbit when the pixel gets closer to it
+        # than to the current reference point, or when the reference has escaped
+        z_0 = z - orbit[0]
+        if k >= last or z_0.real * z_0.real + z_0.imag * z_0.imag < dz.real * dz.real + dz.imag * dz.imag:
+            dz = z_0
+            k = 0
+        # (Z + dz)^p - Z^p evaluated by Horner's scheme in dz
+        t = 1.0 + 0j
+        for m in range(power - 1, 0, -1):
+            t = t * dz + coefficients[k, m]
+        dz = t * dz + dc
+        k += 1
+    return 0.0
+
+
+@njit(parallel=True, fastmath=True, nogil=True, cache=True)
+def _perturbation_set(r1, r2, orbit, coefficients, n, horizon, power, mandelbrot, n3):
+    log_horizon = math.log(math.log(horizon))
+    log_power = math.log(float(power))
+    length, height = r1.size, r2.size
+
+    for i in prange(length):
+        for j in range(height):
+            n3[i, j] = _perturbation_value(complex(r1[i], r2[j]), orbit, coefficients, n, horizon, log_horizon,
+                                           log_power, power, mandelbrot)
+    return n3
+
+
+@njit(parallel=True, fastmath=True, nogil=True, cache=True)
+def _log_polar_perturbation_set(rho_min, step, orbit, coefficients, n_rows, horizon, power, mandelbrot, n3):
+    # Row b, column a of n3 is the pixel at exp(rho_min + b * step) * e^(i a step) from the
+    # reference point, iterated n_rows[b] times
+    log_horizon = math.log(math.log(horizon))
+    log_power = math.log(float(power))
+    rows, columns = n3.shape
+
+    for b in prange(rows):
+        radius = math.exp(rho_min + b * step)
+        for a in range(columns):
+            delta = complex(radius * math.cos(a * step), radius * math.sin(a * step))
+            n3[b, a] = _perturbation_value(delta, orbit, coefficients, n_rows[b], horizon, log_horizon, log_power,
+                                           power, mandelbrot)
+    return n3
+
+
+def perturbation_reference(x_centre, y_centre, delta_x, delta_y, x_c, y_c, height, length, n, horizon,
+                           power=2, mode='mandelbrot'):
+    """Computes the reference orbit through the view centre and its expansion coefficients."""
+    if power < 2 or power > 8:
+        raise ValueError('Power must be between 2 and 8.')
+    delta_x, delta_y = abs(float(delta_x)), abs(float(delta_y))
+    if delta_x == 0 or delta_y == 0:
+        raise ValueError('The view has a zero width or height in float64: its bounds are too deep to tell apart. '
+                         'Give the centre as a str or Decimal and the widths to fractal_set_perturbation.')
+    digits = max(30, math.ceil(-math.log10(min(delta_x / length, delta_y / height))) + 20)
+    orbit = reference_orbit(x_centre, y_centre, x_c, y_c, n, horizon, power=power, mode=mode, digits=digits)
+    return orbit, _binomial_coefficients(orbit, power)
+
+
+def fractal_set_perturbation(x_centre, y_centre, delta_x, delta_y, x_c, y_c, height, length, n, horizon,
+                             power=2, mode='mandelbrot'):
+    """Renders the Mandelbrot or Julia set by perturbation around a high-precision reference orbit."""
+    orbit, coefficients = perturbation_reference(x_centre, y_centre, delta_x, delta_y, x_c, y_c, height, length,
+                                                 n, horizon, power=power, mode=mode)
+    delta_x, delta_y = abs(float(delta_x)), abs(float(delta_y))
+    r1 = np.linspace(-delta_x / 2, delta_x / 2, length)
+    r2 = np.linspace(-delta_y / 2, delta_y / 2, height)
+    n3 = _perturbation_set(r1, r2, orbit, coefficients, n, horizon, power, mode == 'mandelbrot',
+                           np.empty((length, height)))
+    return r1, r2, n3
@@ -1,9 +1,7 @@
 import argparse
-import glob
 import json
 import multiprocessing as mp
 import os
-import re
 import warnings
 from datetime import datetime as dt
 
@@ -12,7 +10,10 @@ import numpy as np
 from matplotlib import colors
 
 import config as cfg
-from fractal_calculation import fractal_set
+from colouring import colour_image, colour_lut, shade_image
+from fractal_calculation import adaptive_supersample, choose_precision, fractal_set, warm_up, warm_up_cache
+from tile_store import TileStore
+from video_stream import VideoStream, frame_buffer, video_filename, video_frame
 
 
 def make_colourmap(colours_data):
@@ -33,23 +34,35 @@ def make_colourmap(colours_data):
 
 
 def make_frame(i, xmin, xmax, ymin, ymax, x_c, y_c, mode, n, power, horizon, length, height,
-               colourmap, c_regime, freq, offset, shading, azdeg, altdeg, vert_exag, supersampling, path, frames):
+               colourmap, c_regime, freq, offset, shading, azdeg, altdeg, vert_exag, supersampling, path, frames,
+               store=None, png=True, video=False):
     """Generate a single frame for the animation."""
     print(f'Frame {i + 1} / {frames}')
 
-    data = fractal_set(xmin, xmax, ymin, ymax, horizon=horizon, length=length*supersampling,
-                       height=height*supersampling, n=n, x_c=x_c, y_c=y_c, power=power, mode=mode)[2].T
-    if c_regime == 'standard':
-        pass
-    elif c_regime == 'sin':
-        data = (np.sin(data * freq + offset)) ** 2
-    data = data.reshape((height, supersampling, length, supersampling)).mean(axis=(1, 3))
+    kwargs = dict(horizon=horizon, n=n, x_c=x_c, y_c=y_c, power=power, mode=mode)
+    if supersampling > 1:
+        # The colouring regime is applied to the subpixels, before they are averaged
+        transform = None
+        if c_regime == 'sin':
+            transform = lambda values: (np.sin(values * freq + offset)) ** 2
+        data = adaptive_supersample(xmin, xmax, ymin, ymax, length=length, height=height,
+                                    supersampling=supersampling, transform=transform, **kwargs).T
+        c_regime = 'standard'
+    elif store:
+        data = TileStore(store, max_bytes=cfg.TILE_STORE_DISK).render(xmin, xmax, ymin, ymax, length=length,
+                                                                      height=height, **kwargs).T
+    else:
+        data = fractal_set(xmin, xmax, ymin, ymax, length=length, height=height, layout='yx',
+                           out=frame_buffer((height, length)), **kwargs)[2]
     if shading:
-        light = colors.LightSource(azdeg=azdeg, altdeg=altdeg)
-        data = light.shade(data, cmap=plt.get_cmap(colourmap), vert_exag=vert_exag,
-                           blend_mode='hsv')
-    plt.imsave(path + f'image_{i:d}.png', data,
-               cmap=colourmap if not shading else None, origin='lower')
+        image = shade_image(data, colour_lut(colourmap, bytes=False), azdeg, altdeg, vert_exag,
+                            c_regime, freq, offset)
+    else:
+        image = colour_image(data, colour_lut(colourmap), c_regime, freq, offset)
+    if png:
+        plt.imsave(path + f'image_{i:d}.png', image)
+    if video:
+        return video_frame(image)
 
 
 def validate_aspect_ratio(xmin, xmax, ymin, ymax, length, height):
@@ -76,37 +89,10 @@ def validate_aspect_ratio(xmin, xmax, ymin, ymax, length, height):
     return length, height
 
 
-def generate_video(path, name, fps=30):
-    """Generate a video from the saved frames."""
-    import cv2
-
-    # List of PNG files
-    files = glob.glob(path + 'image_*.png')
-    image_files = sorted(files, key=lambda x: int(re.search(r'\d+', x[len(path):]).group()))
-
-    # Read first image to get dimensions
-    frame = cv2.imread(image_files[0])
-    h, w, _ = frame.shape
-
-    if not name:
-        name = 'output.mp4'
-    if name[-4:] != '.mp4':
-        name += '.mp4'
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # Codec for mp4 format
-    out = cv2.VideoWriter(path + name, fourcc, fps, (w, h))
-
-    # Write images to video
-    for img_file in image_files:
-        frame = cv2.imread(img_file)  # Read image
-        out.write(frame)  # Write frame
-
-    out.release()  # Save and close file
-    print(f"Video saved as {path}{name}")
-
-
 def main(metadata, xmin, xmax, ymin, ymax, rho, phi_min, phi_max, mode, n, power,
          horizon, frames, length, height, colourmap,
-         c_regime, freq, offset, shading, azdeg, altdeg, vert_exag, threads, supersampling, path):
+         c_regime, freq, offset, shading, azdeg, altdeg, vert_exag, threads, supersampling, path,
+         store=None, video=None, png=True):
     """Main function to generate the rotational animation of a Julia set."""
     if not isinstance(colourmap, str):
         colourmap = make_colourmap(colourmap)
@@ -150,20 +136,34 @@ def main(metadata, xmin, xmax, ymin, ymax, rho, phi_min, phi_max, mode, n, power
     angle = np.linspace(phi_min, phi_max, frames)
     x_c = rho * np.sin(angle)
     y_c = rho * np.cos(angle)
-    pool = mp.Pool(threads)
-
-    result = [pool.apply_async(make_frame, kwds={'i': i, 'xmin': xmin, 'xmax': xmax, 'ymin': ymin, 'ymax': ymax,
-                                                 'x_c': x_cc, 'y_c': y_cc, 'n': n, 'power': power, 'horizon': horizon,
-                                                 'mode': mode, 'length': length, 'height': height,
-                                                 'colourmap': colourmap, 'supersampling': abs(supersampling),
-                                                 'c_regime': c_regime, 'freq': freq, 'offset': offset,
-                                                 'shading': shading, 'azdeg': azdeg, 'altdeg': altdeg,
-                                                 'vert_exag': vert_exag, 'path': path, 'frames': frames})
-              for i, (x_cc, y_cc) in enumerate(zip(x_c, y_c))]
-
-    im_arr = [res.get() for res in result]
-    pool.close()
-    pool.join()
+    # The view is fixed, so only the kernel of its precision is needed. Compile it once
+    # so that the workers only load it from the disk cache (in both layouts, see make_frame)
+    warm_up_args = ((mode,), (power,), (choose_precision(xmin, xmax, ymin, ymax, length * abs(supersampling),
+                                                         height * abs(supersampling), mode=mode),), ('xy', 'yx'))
+    warm_up_cache(*warm_up_args)
+    pool = mp.Pool(threads, initializer=warm_up, initargs=warm_up_args)
+
+    stream = VideoStream(video, length, height) if video else None
+    try:
+        result = [pool.apply_async(make_frame, kwds={'i': i, 'xmin': xmin, 'xmax': xmax, 'ymin': ymin, 'ymax': ymax,
+                                                     'x_c': x_cc, 'y_c': y_cc, 'n': n, 'power': power,
+                                                     'horizon': horizon, 'mode': mode, 'length': length,
+                                                     'height': height, 'colourmap': colourmap,
+                                                     'supersampling': abs(supersampling), 'c_regime': c_regime,
+                                                     'freq': freq, 'offset': offset, 'shading': shading,
+                                                     'azdeg': azdeg, 'altdeg': altdeg, 'vert_exag': vert_exag,
+                                                     'path': path, 'frames': frames, 'store': store, 'png': png,
+                                                     'video': stream is not None},
+                                   callback=stream.callback(i) if stream else None)
+                  for i, (x_cc, y_cc) in enumerate(zip(x_c, y_c))]
+
+        for res in result:
+            res.get()
+        pool.close()
+        pool.join()
+    finally:
+        if stream:
+            stream.close()
     print('Completed in:', dt.now() - time0)
 
 
@@ -232,6 +232,12 @@ if __name__ == '__main__':
                         help='Number of threads to use for frame creation (default: number of CPU cores - 2).')
     parser.add_argument('-ss', '--supersampling', type=int, default=1,
                         help='Supersampling (SSAA) factor for the image rendering (default: 1).')
+    parser.add_argument('--store', type=str, nargs='?', const=cfg.TILE_STORE_DIR,
+                        help='Read the fields of the frames from, and write them to, the tile store in this '
+                             f'directory (without a value: {cfg.TILE_STORE_DIR}).')
+    parser.add_argument('--png', action='store_true', default=False,
+                        help='Also save every frame as image_<i>.png. The video is encoded from the frames '
+                             'as they are made either way.')
     args = parser.parse_args()
     path = input('Enter the path to the folder where the frames and video will be saved (default: tmp/): ')
     if not path:
@@ -239,7 +245,5 @@ if __name__ == '__main__':
     if path[-1] != '/':
         path += '/'
     os.makedirs(path, exist_ok=True)
-    main(**vars(args), path=path)
     video_name = input('Enter the name for the video (default: output.mp4): ')
-
-    generate_video(path, video_name)
+    main(**vars(args), path=path, video=video_filename(path, video_name))
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from fractal_calculation import fractal_fields
+
+X_C, Y_C = -0.8, -0.156
+# Views of the modes, shifted so that no pixel lies on the folds of the Burning Ship
+# (Re z = 0 or Im z = 0), where its derivative is not defined
+VIEWS = {'mandelbrot': (-1.9877, 0.5123, -1.2377, 1.2623), 'julia': (-1.5877, 1.6123, -1.5877, 1.6123),
+         'burning_ship': (-2.1877, 1.5123, -1.8377, 0.6123),
+         'burning_ship_julia': (-1.9877, 2.0123, -1.9877, 2.0123)}
+
+
+def orbit_end(z, c, mode, power, steps):
+    for _ in range(steps):
+        if mode in {'burning_ship', 'burning_ship_julia'}:
+            z = complex(abs(z.real), abs(z.imag))
+        z = z ** power + c
+    return z
+
+
+@pytest.mark.parametrize('power', [2, 3, 4])
+@pytest.mark.parametrize('mode', list(VIEWS))
+def test_derivative_matches_finite_differences(mode, power):
+    r1, r2, data = fractal_fields(*VIEWS[mode], X_C, Y_C, 21, 21, 30, 4.0, power=power, mode=mode,
+                                  periodicity=False)
+    h = 1e-7
+    mismatches, escaped = 0, 0
+    for i, x in enumerate(r1):
+        for j, y in enumerate(r2):
+            if data['interior'][i, j]:
+                continue
+            pixel = complex(x, y)
+            steps = int(data['count'][i, j])
+
+            def end(point):
+                c = complex(X_C, Y_C) if mode in {'julia', 'burning_ship_julia'} else point
+                return orbit_end(point, c, mode, power, steps)
+
+            # The derivative is taken along the real axis, which is also |dz/dc| where z is holomorphic
+            finite_difference = abs(end(pixel + h) - end(pixel - h)) / (2 * h)
+            escaped += 1
+            mismatches += not np.isclose(data['derivative'][i, j], finite_difference, rtol=1e-3)
+    assert escaped > 300
+    # Orbits passing within h of a fold are not differentiable there
+    assert mismatches <= 0.01 * escaped
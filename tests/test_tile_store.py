@@ -0,0 +1,23 @@
+import time
+
+import numpy as np
+
+from tile_store import TileStore
+
+VIEW = dict(xmin=-2.0, xmax=0.5, ymin=-1.25, ymax=1.25, x_c=-0.8, y_c=-0.156, height=16, length=32, horizon=4.0,
+            precision='float64')
+
+
+def test_least_recently_used_fields_are_evicted(tmp_path):
+    field = np.zeros((32, 16))
+    store = TileStore(str(tmp_path), max_bytes=2.5 * field.nbytes)
+    # The pauses keep the modification times, which order the files, apart
+    for n in (10, 20):
+        store.save(field, n=n, **VIEW)
+        time.sleep(0.05)
+    assert store.load(n=10, **VIEW) is not None
+    time.sleep(0.05)
+    store.save(field + 1, n=30, **VIEW)
+    assert store.load(n=20, **VIEW) is None
+    assert store.load(n=10, **VIEW) is not None
+    np.testing.assert_array_equal(store.load(n=30, **VIEW), field + 1)
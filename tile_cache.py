@@ -0,0 +1,80 @@
+import math
+from collections import OrderedDict
+from fractions import Fraction
+
+import numpy as np
+
+from fractal_calculation import exact_grid
+
+# Parameters of a render request, besides its view, that the pixel values depend on
+KEY_PARAMS = ('mode', 'power', 'x_c', 'y_c', 'n', 'horizon', 'precision')
+
+
+def _axis_level(vmin, vmax, count, shared):
+    """Returns (level, origin) of the pixel lattice of one axis of a view."""
+    if not shared:
+        return (float(vmin), float(vmax), count), 0
+    vmin = Fraction(float(vmin))
+    step = (Fraction(float(vmax)) - vmin) / max(count - 1, 1)
+    origin = math.floor(vmin / step)
+    return (float(step), float(vmin - origin * step)), origin
+
+
+class TileCache:
+    """LRU cache of rendered iteration fields, split into tiles keyed by their pixel lattice."""
+
+    def __init__(self, max_bytes=256 * 2 ** 20, tile_size=64):
+        self.max_bytes = max_bytes
+        self.tile_size = tile_size
+        self.bytes = 0
+        self.hits, self.misses, self.evictions = 0, 0, 0
+        self._tiles = OrderedDict()
+
+    def _layout(self, kwargs):
+        """Yields (key, view part, tile part) for every tile covering the view of a render request."""
+        length, height = kwargs['length'], kwargs['height']
+        shared = (kwargs['precision'] != 'perturbation' and exact_grid(kwargs['xmin'], kwargs['xmax'], length) and
+                  exact_grid(kwargs['ymin'], kwargs['ymax'], height))
+        level_x, origin_x = _axis_level(kwargs['xmin'], kwargs['xmax'], length, shared)
+        level_y, origin_y = _axis_level(kwargs['ymin'], kwargs['ymax'], height, shared)
+        params = tuple(kwargs[key] for key in KEY_PARAMS) + (kwargs.get('periodicity', True),)
+        size = self.tile_size
+        for tx in range(origin_x // size, (origin_x + length - 1) // size + 1):
+            a0, a1 = max(tx * size, origin_x), min((tx + 1) * size, origin_x + length)
+            for ty in range(origin_y // size, (origin_y + height - 1) // size + 1):
+                b0, b1 = max(ty * size, origin_y), min((ty + 1) * size, origin_y + height)
+                yield ((params, level_x, level_y, tx, ty),
+                       (slice(a0 - origin_x, a1 - origin_x), slice(b0 - origin_y, b1 - origin_y)),
+                       (slice(a0 - tx * size, a1 - tx * size), slice(b0 - ty * size, b1 - ty * size)))
+
+    def lookup(self, kwargs):
+        """Puts together the cached part of a view: the field, NaN where unknown, and its known mask."""
+        field = np.full((kwargs['length'], kwargs['height']), np.nan)
+        for key, view_part, tile_part in self._layout(kwargs):
+            tile = self._tiles.get(key)
+            if tile is None:
+                self.misses += 1
+                continue
+            self._tiles.move_to_end(key)
+            field[view_part] = tile[tile_part]
+            if np.isnan(field[view_part]).any():
+                self.misses += 1
+            else:
+                self.hits += 1
+        return field, ~np.isnan(field)
+
+    def store(self, kwargs, field):
+        """Adds the finished field of a render request to the tiles, evicting the oldest ones."""
+        for key, view_part, tile_part in self._layout(kwargs):
+            tile = self._tiles.get(key)
+            if tile is None:
+                tile = np.full((self.tile_size, self.tile_size), np.nan)
+                self._tiles[key] = tile
+                self.bytes += tile.nbytes
+            else:
+                self._tiles.move_to_end(key)
+            tile[tile_part] = field[view_part]
+        while self.bytes > self.max_bytes and self._tiles:
+            _, tile = self._tiles.popitem(last=False)
+            self.bytes -= tile.nbytes
+            self.evictions += 1
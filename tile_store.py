@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from fractal_calculation import choose_precision, fractal_set
+
+
+class TileStore:
+    """On-disk LRU store of raw iteration fields, shared by the GUI and the animation scripts."""
+
+    def __init__(self, directory, max_bytes=2 ** 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def params(xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power=2, mode='mandelbrot',
+               periodicity=True, precision='auto'):
+        """The render parameters in a canonical form, with 'auto' precision resolved."""
+        if precision == 'auto':
+            precision = choose_precision(xmin, xmax, ymin, ymax, length, height, mode=mode)
+        return {'xmin': float(xmin), 'xmax': float(xmax), 'ymin': float(ymin), 'ymax': float(ymax),
+                'x_c': float(x_c), 'y_c': float(y_c), 'height': int(height), 'length': int(length), 'n': int(n),
+                'horizon': float(horizon), 'power': int(power), 'mode': mode, 'periodicity': bool(periodicity),
+                'precision': precision}
+
+    def _path(self, params):
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+        return os.path.join(self.directory, digest + '.npy')
+
+    def load(self, **kwargs):
+        """Returns the stored field as a read-only memory map, or None if it is not stored."""
+        params = self.params(**kwargs)
+        try:
+            field = np.load(self._path(params), mmap_mode='r')
+        except FileNotFoundError:
+            return None
+        if field.shape != (params['length'], params['height']):
+            return None
+        try:
+            os.utime(self._path(params))
+        except FileNotFoundError:  # evicted by another process in the meantime
+            pass
+        return field
+
+    def save(self, field, **kwargs):
+        """Stores the (length, height) field computed with the parameters of `fractal_set`."""
+        params = self.params(**kwargs)
+        path = self._path(params)
+        try:
+            os.utime(path)
+            return
+        except FileNotFoundError:
+            pass
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary, 'wb') as f:
+            np.save(f, np.asarray(field, dtype=np.float64))
+        os.replace(temporary, path)
+        self._evict(keep=path)
+
+    def _evict(self, keep):
+        """Deletes the least recently used files, other than `keep`, until the store fits in `max_bytes`."""
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith('.npy'):
+                    try:
+                        status = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((status.st_mtime, status.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def render(self, xmin, xmax, ymin, ymax, x_c, y_c, height, length, n, horizon, power=2, mode='mandelbrot',
+               periodicity=True, precision='auto'):
+        """Returns the field n3 of `fractal_set`, from the store if it is there, otherwise computed and stored."""
+        kwargs = dict(xmin=xmin, xmax=xmax, ymin=ymin, ymax=ymax, x_c=x_c, y_c=y_c, height=height, length=length,
+                      n=n, horizon=horizon, power=power, mode=mode, periodicity=periodicity, precision=precision)
+        field = self.load(**kwargs)
+        if field is None:
+            field = fractal_set(**kwargs)[2]
+            self.save(field, **kwargs)
+        return field
@@ -16,9 +16,9 @@ class Ui_Save(object):
     def setupUi(self, Save):
         if not Save.objectName():
             Save.setObjectName(u"Save")
-        Save.resize(263, 274)
-        Save.setMinimumSize(QSize(263, 274))
-        Save.setMaximumSize(QSize(263, 274))
+        Save.resize(263, 300)
+        Save.setMinimumSize(QSize(263, 300))
+        Save.setMaximumSize(QSize(263, 300))
         self.gridLayout_2 = QGridLayout(Save)
         self.gridLayout_2.setObjectName(u"gridLayout_2")
         self.gridLayout = QGridLayout()
@@ -42,7 +42,7 @@ class Ui_Save(object):
         self.label_Size.setObjectName(u"label_Size")
         self.label_Size.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
-        self.gridLayout.addWidget(self.label_Size, 5, 0, 1, 2)
+        self.gridLayout.addWidget(self.label_Size, 6, 0, 1, 2)
 
         self.lineEdit_H = QLineEdit(Save)
         self.lineEdit_H.setObjectName(u"lineEdit_H")
@@ -59,11 +59,16 @@ class Ui_Save(object):
 
         self.gridLayout.addWidget(self.checkBox_lockAR, 4, 1, 1, 1)
 
+        self.checkBox_store = QCheckBox(Save)
+        self.checkBox_store.setObjectName(u"checkBox_store")
+
+        self.gridLayout.addWidget(self.checkBox_store, 5, 0, 1, 2)
+
         self.pushButton_Save = QPushButton(Save)
         self.pushButton_Save.setObjectName(u"pushButton_Save")
         self.pushButton_Save.setAutoDefault(True)
 
-        self.gridLayout.addWidget(self.pushButton_Save, 6, 0, 1, 2, Qt.AlignmentFlag.AlignHCenter)
+        self.gridLayout.addWidget(self.pushButton_Save, 7, 0, 1, 2, Qt.AlignmentFlag.AlignHCenter)
 
         self.label_L = QLabel(Save)
         self.label_L.setObjectName(u"label_L")
@@ -91,7 +96,8 @@ class Ui_Save(object):
         QWidget.setTabOrder(self.lineEdit_H, self.lineEdit_DPI)
         QWidget.setTabOrder(self.lineEdit_DPI, self.checkBox_withAxes)
         QWidget.setTabOrder(self.checkBox_withAxes, self.checkBox_lockAR)
-        QWidget.setTabOrder(self.checkBox_lockAR, self.pushButton_Save)
+        QWidget.setTabOrder(self.checkBox_lockAR, self.checkBox_store)
+        QWidget.setTabOrder(self.checkBox_store, self.pushButton_Save)
 
         self.retranslateUi(Save)
 
@@ -106,6 +112,10 @@ class Ui_Save(object):
         self.label_Size.setText(QCoreApplication.translate("Save", u"The size of will be", None))
         self.label_H.setText(QCoreApplication.translate("Save", u"Height:", None))
         self.checkBox_lockAR.setText(QCoreApplication.translate("Save", u"Lock Aspect Ratio", None))
+        # if QT_CONFIG(tooltip)
+        self.checkBox_store.setToolTip(QCoreApplication.translate("Save", u"Keep the iterations in the tile store, so that saving the same view again reads them from the disk", None))
+        # endif // QT_CONFIG(tooltip)
+        self.checkBox_store.setText(QCoreApplication.translate("Save", u"Keep in Tile Store", None))
         self.pushButton_Save.setText(QCoreApplication.translate("Save", u"Save", None))
         self.label_L.setText(QCoreApplication.translate("Save", u"Length:", None))
         # if QT_CONFIG(tooltip)
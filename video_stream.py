@@ -0,0 +1,72 @@
+import threading
+
+import numpy as np
+
+
+# Output array of the frames of this worker process, reused from frame to frame
+_frame_buffers = {}
+
+
+def frame_buffer(shape):
+    """Returns the (height, length) array that this process renders its frames into."""
+    if shape not in _frame_buffers:
+        _frame_buffers[shape] = np.empty(shape)
+    return _frame_buffers[shape]
+
+
+def video_filename(path, name):
+    """The mp4 file of the video `name` in `path` (default: output.mp4)."""
+    if not name:
+        name = 'output.mp4'
+    if name[-4:] != '.mp4':
+        name += '.mp4'
+    return path + name
+
+
+def video_frame(image):
+    """The BGR bytes of an RGB(A) uint8 image, as OpenCV encodes them."""
+    return np.ascontiguousarray(image[..., 2::-1])
+
+
+class VideoStream:
+    """Encodes the frames of an animation into an mp4 video in order, whatever order they arrive in."""
+
+    def __init__(self, filename, length, height, fps=30):
+        import cv2
+
+        self.filename = filename
+        self.written = 0
+        self._buffer = {}
+        self._lock = threading.Lock()
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # Codec for mp4 format
+        self._writer = cv2.VideoWriter(filename, fourcc, fps, (length, height))
+        if not self._writer.isOpened():
+            raise ValueError(f'Cannot open {filename} for writing.')
+
+    def write(self, i, frame):
+        """Hands over frame i as (height, length, 3) BGR bytes (see `video_frame`)."""
+        with self._lock:
+            self._buffer[i] = frame
+            while self.written in self._buffer:
+                self._writer.write(self._buffer.pop(self.written))
+                self.written += 1
+
+    def callback(self, i):
+        """The callback of `apply_async` writing the frame returned by the task of frame i."""
+        return lambda frame: self.write(i, frame)
+
+    def close(self):
+        """Finishes the video. Frames still waiting for an earlier one are dropped."""
+        with self._lock:
+            self._writer.release()
+            dropped = len(self._buffer)
+            self._buffer.clear()
+        if dropped:
+            print(f'{dropped} frames after frame {self.written} were not written to the video')
+        print(f'Video saved as {self.filename}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
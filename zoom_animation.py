@@ -1,9 +1,7 @@
 import argparse
-import glob
 import json
 import multiprocessing as mp
 import os
-import re
 from datetime import datetime as dt
 
 import matplotlib.pyplot as plt
@@ -11,7 +9,13 @@ import numpy as np
 from matplotlib import colors
 
 import config as cfg
-from fractal_calculation import fractal_set
+from colouring import colour_image, colour_lut, shade_image
+from exponential_map import remap_strip, strip_geometry
+from fractal_calculation import (adaptive_supersample, choose_precision, fractal_set, log_polar_set, warm_up,
+                                 warm_up_cache)
+from keyframes import composite_keyframes, interpolate_view, keyframe_level, keyframe_view
+from tile_store import TileStore
+from video_stream import VideoStream, frame_buffer, video_filename, video_frame
 
 
 def make_colourmap(colours_data):
@@ -31,40 +35,188 @@ def make_colourmap(colours_data):
     return colourmap
 
 
+def frame_iterations(zoom, final_zoom, n_regime, n_i, n_f):
+    """Number of iterations at the given zoom relative to the initial fractal."""
+    if n_regime == 'static':
+        return n_f
+    elif n_f is None:
+        return int(n_i * (1 + np.log10(zoom)))
+    alpha = (n_f / n_i - 1) / np.log10(final_zoom)
+    return int(n_i * (1 + alpha * np.log10(zoom)))
+
+
+def save_frame(i, data, colourmap, c_regime, freq, offset, shading, azdeg, altdeg, vert_exag, path, png=True,
+               video=False):
+    """Colour the field of frame i, save it as a PNG and/or return it for the video."""
+    if shading:
+        image = shade_image(data, colour_lut(colourmap, bytes=False), azdeg, altdeg, vert_exag,
+                            c_regime, freq, offset)
+    else:
+        image = colour_image(data, colour_lut(colourmap), c_regime, freq, offset)
+    if png:
+        plt.imsave(path + f'image_{i:d}.png', image)
+    if video:
+        return video_frame(image)
+
+
 def make_frame(i, scale, xmin_1, xmax_1, ymin_1, ymax_1, xmin_2, xmax_2, ymin_2, ymax_2,
                mode, x_c, y_c, power, n_regime, n_i, n_f, horizon, length, height, colourmap,
-               c_regime, freq, offset, shading, azdeg, altdeg, vert_exag, supersampling, path, frames):
+               c_regime, freq, offset, shading, azdeg, altdeg, vert_exag, supersampling, path, frames,
+               store=None, png=True, video=False):
     """Generate a single frame for the zoom animation."""
-    xmin_3 = (1 - scale) * xmin_1 + scale * xmin_2
-    ymin_3 = (1 - scale) * ymin_1 + scale * ymin_2
-    xmax_3 = (1 - scale) * xmax_1 + scale * xmax_2
-    ymax_3 = (1 - scale) * ymax_1 + scale * ymax_2
+    xmin_3, xmax_3, ymin_3, ymax_3 = interpolate_view(scale, (xmin_1, xmax_1, ymin_1, ymax_1),
+                                                      (xmin_2, xmax_2, ymin_2, ymax_2))
+    n = frame_iterations((xmax_1 - xmin_1) / (xmax_3 - xmin_3), (xmax_1 - xmin_1) / (xmax_2 - xmin_2),
+                         n_regime, n_i, n_f)
 
-    zoom = (xmax_1 - xmin_1) / (xmax_3 - xmin_3)
-    if n_regime == 'static':
-        n = n_f
-    elif n_f is None:
-        n = int(n_i * (1 + np.log10(zoom)))
+    print(f'Frame {i + 1} / {frames}')
+
+    precision = choose_precision(xmin_3, xmax_3, ymin_3, ymax_3, length*supersampling, height*supersampling,
+                                 mode=mode)
+    kwargs = dict(horizon=horizon, n=n, x_c=x_c, y_c=y_c, power=power, mode=mode, precision=precision)
+    if supersampling > 1:
+        # The colouring regime is applied to the subpixels, before they are averaged
+        transform = None
+        if c_regime == 'sin':
+            transform = lambda values: (np.sin(values * freq + offset)) ** 2
+        data = adaptive_supersample(xmin_3, xmax_3, ymin_3, ymax_3, length=length, height=height,
+                                    supersampling=supersampling, transform=transform, **kwargs).T
+        c_regime = 'standard'
+    elif store:
+        data = TileStore(store, max_bytes=cfg.TILE_STORE_DISK).render(xmin_3, xmax_3, ymin_3, ymax_3, length=length,
+                                                                      height=height, **kwargs).T
     else:
-        final_zoom = (xmax_1 - xmin_1) / (xmax_2 - xmin_2)
-        alpha = (n_f / n_i - 1) / np.log10(final_zoom)
-        n = int(n_i * (1 + alpha * np.log10(zoom)))
+        data = fractal_set(xmin_3, xmax_3, ymin_3, ymax_3, length=length, height=height, layout='yx',
+                           out=frame_buffer((height, length)), **kwargs)[2]
+    return save_frame(i, data, colourmap, c_regime, freq, offset, shading, azdeg, altdeg, vert_exag, path, png,
+                      video)
 
-    print(f'Frame {i + 1} / {frames}')
 
-    data = fractal_set(xmin_3, xmax_3, ymin_3, ymax_3, horizon=horizon, length=length*supersampling,
-                       height=height*supersampling, n=n, x_c=x_c, y_c=y_c, power=power, mode=mode)[2].T
-    if c_regime == 'standard':
-        pass
-    elif c_regime == 'sin':
+def render_keyframe(k, view_1, view_2, mode, x_c, y_c, power, n_regime, n_i, n_f, horizon, length, height,
+                    c_regime, freq, offset, supersampling, path, store=None):
+    """Render keyframe k into path/keyframe_k.npy and return the file and its view."""
+    xmin, xmax, ymin, ymax, k_length, k_height, width = keyframe_view(k, view_1, view_2, length, height,
+                                                                      supersampling)
+    n = frame_iterations((view_1[1] - view_1[0]) / width, (view_1[1] - view_1[0]) / (view_2[1] - view_2[0]),
+                         n_regime, n_i, n_f)
+    print(f'Keyframe {k} ({k_length} x {k_height}, N = {n})')
+    kwargs = dict(horizon=horizon, n=n, x_c=x_c, y_c=y_c, power=power, mode=mode)
+    if store:
+        data = TileStore(store, max_bytes=cfg.TILE_STORE_DISK).render(xmin, xmax, ymin, ymax, length=k_length,
+                                                                      height=k_height, **kwargs).T
+    else:
+        data = fractal_set(xmin, xmax, ymin, ymax, length=k_length, height=k_height, layout='yx', **kwargs)[2]
+    if c_regime == 'sin':
         data = (np.sin(data * freq + offset)) ** 2
-    data = data.reshape((height, supersampling, length, supersampling)).mean(axis=(1, 3))
-    if shading:
-        light = colors.LightSource(azdeg=azdeg, altdeg=altdeg)
-        data = light.shade(data, cmap=plt.get_cmap(colourmap), vert_exag=vert_exag,
-                           blend_mode='hsv')
-    plt.imsave(path + f'image_{i:d}.png', data,
-               cmap=colourmap if not shading else None, origin='lower')
+    filename = path + f'keyframe_{k:d}.npy'
+    np.save(filename, data)
+    return filename, (xmin, xmax, ymin, ymax)
+
+
+def make_keyframe_frame(i, view, coarse, fine, length, height, colourmap, c_regime, freq, offset, shading, azdeg,
+                        altdeg, vert_exag, path, frames, png=True, video=False):
+    """Generate a single frame of the zoom animation from the (file, view) of its two keyframes."""
+    print(f'Frame {i + 1} / {frames}')
+    (coarse_file, coarse_view), (fine_file, fine_view) = coarse, fine
+    data = composite_keyframes(np.asarray(np.load(coarse_file, mmap_mode='r')), coarse_view,
+                               np.asarray(np.load(fine_file, mmap_mode='r')), fine_view, view,
+                               frame_buffer((height, length)))
+    return save_frame(i, data, colourmap, c_regime, freq, offset, shading, azdeg, altdeg, vert_exag, path, png,
+                      video)
+
+
+def keyframe_animation(pool, threads, scales, view_1, view_2, mode, x_c, y_c, power, n_regime, n_i, n_f, horizon,
+                       length, height, colourmap, c_regime, freq, offset, shading, azdeg, altdeg, vert_exag,
+                       supersampling, path, store=None, png=True, stream=None):
+    """Generate the frames of the zoom from keyframes rendered in the pool."""
+    views = [interpolate_view(scale, view_1, view_2) for scale in scales]
+    levels = [keyframe_level(view, view_1) for view in views]
+    needed = sorted({k for level in levels for k in (level, level + 1)})
+    keyframes, renders, results, submitted = {}, {}, {}, 0
+    for level in sorted(set(levels)):
+        # Keyframes stay on the disk until no frame needs them, so only a few are rendered ahead
+        while submitted < min(needed.index(level + 1) + threads, len(needed)):
+            k = needed[submitted]
+            renders[k] = pool.apply_async(render_keyframe, args=(k, view_1, view_2, mode, x_c, y_c, power, n_regime,
+                                                                 n_i, n_f, horizon, length, height, c_regime, freq,
+                                                                 offset, supersampling, path, store))
+            submitted += 1
+        for k in (level, level + 1):
+            if k not in keyframes:
+                keyframes[k] = renders.pop(k).get()
+        # The 'sin' regime is already applied to the keyframes
+        results[level] = [pool.apply_async(make_keyframe_frame,
+                                           args=(i, view, keyframes[level], keyframes[level + 1], length, height,
+                                                 colourmap, 'standard', freq, offset, shading, azdeg, altdeg,
+                                                 vert_exag, path, len(scales), png, stream is not None),
+                                           callback=stream.callback(i) if stream else None)
+                          for i, view in enumerate(views) if levels[i] == level]
+        for done in [k for k in results if k < level]:
+            for res in results.pop(done):
+                res.get()
+            os.remove(keyframes.pop(done)[0])
+    for level in results:
+        for res in results[level]:
+            res.get()
+    for filename, _ in keyframes.values():
+        os.remove(filename)
+    print(f'{len(needed)} keyframes rendered for {len(scales)} frames')
+
+
+def render_strip(x_centre, y_centre, delta_x_1, delta_y_1, delta_x_2, delta_y_2, mode, x_c, y_c, power, n_regime,
+                 n_i, n_f, horizon, length, height, supersampling, path):
+    """Render the exponential map of the zoom into path/exp_map.npy and return the file and rho_min."""
+    rho_min, rows, columns = strip_geometry(delta_x_1, delta_y_1, delta_x_2, delta_y_2, length, height,
+                                            supersampling)
+    step = 2 * np.pi / columns
+    final_zoom = delta_x_1 / delta_x_2
+    # Zoom of the frame whose half-diagonal is the radius of the row
+    zooms = np.clip(delta_x_1 * np.hypot(1, delta_y_1 / delta_x_1) / 2 / np.exp(rho_min + np.arange(rows) * step),
+                    1, final_zoom)
+    n_rows = np.array([frame_iterations(zoom, final_zoom, n_regime, n_i, n_f) for zoom in zooms])
+    filename = path + 'exp_map.npy'
+    strip = np.lib.format.open_memmap(filename, mode='w+', dtype=np.float32, shape=(rows, columns))
+    for b0 in range(0, rows, cfg.EXP_MAP_BAND):
+        b1 = min(b0 + cfg.EXP_MAP_BAND, rows)
+        print(f'Exponential map: rows {b0 + 1}-{b1} / {rows} ({columns} columns, N <= {n_rows[b0]})')
+        log_polar_set(x_centre, y_centre, rho_min + b0 * step, b1 - b0, columns, x_c, y_c, n_rows[b0:b1], horizon,
+                      power=power, mode=mode, out=strip[b0:b1])
+    strip.flush()
+    return filename, rho_min
+
+
+def make_exp_map_frame(i, strip_file, rho_min, delta_x, delta_y, n, length, height, colourmap, c_regime, freq, offset,
+                       shading, azdeg, altdeg, vert_exag, supersampling, path, frames, png=True, video=False):
+    """Generate a single frame of the zoom animation by reprojecting the exponential map."""
+    print(f'Frame {i + 1} / {frames}')
+    data = remap_strip(np.asarray(np.load(strip_file, mmap_mode='r')), rho_min, delta_x / 2, delta_y / 2, n,
+                       frame_buffer((height, length)), supersampling, c_regime, freq, offset)
+    # The regime is applied to the samples of the strip
+    return save_frame(i, data, colourmap, 'standard', freq, offset, shading, azdeg, altdeg, vert_exag, path, png,
+                      video)
+
+
+def exp_map_animation(pool, scales, x_centre, y_centre, delta_x_1, delta_y_1, delta_x_2, delta_y_2, mode, x_c, y_c,
+                      power, n_regime, n_i, n_f, horizon, length, height, colourmap, c_regime, freq, offset, shading,
+                      azdeg, altdeg, vert_exag, supersampling, path, png=True, stream=None):
+    """Generate the frames of the zoom by reprojecting its exponential map."""
+    strip_file, rho_min = pool.apply(render_strip, args=(x_centre, y_centre, delta_x_1, delta_y_1, delta_x_2,
+                                                         delta_y_2, mode, x_c, y_c, power, n_regime, n_i, n_f,
+                                                         horizon, length, height, supersampling, path))
+    results = []
+    for i, scale in enumerate(scales):
+        # The sizes of the views, without the cancellation of their bounds in deep zooms
+        delta_x = (1 - scale) * delta_x_1 + scale * delta_x_2
+        delta_y = (1 - scale) * delta_y_1 + scale * delta_y_2
+        n = frame_iterations(delta_x_1 / delta_x, delta_x_1 / delta_x_2, n_regime, n_i, n_f)
+        results.append(pool.apply_async(make_exp_map_frame,
+                                        args=(i, strip_file, rho_min, delta_x, delta_y, n, length, height, colourmap,
+                                              c_regime, freq, offset, shading, azdeg, altdeg, vert_exag,
+                                              supersampling, path, len(scales), png, stream is not None),
+                                        callback=stream.callback(i) if stream else None))
+    for res in results:
+        res.get()
+    os.remove(strip_file)
 
 
 def validate_aspect_ratio(delta_x_1, delta_y_1, delta_x_2, delta_y_2, length, height):
@@ -107,39 +259,11 @@ def validate_aspect_ratio(delta_x_1, delta_y_1, delta_x_2, delta_y_2, length, he
     return delta_x_1, delta_y_1, delta_x_2, delta_y_2, length, height
 
 
-def generate_video(path, name, fps=30):
-    """Generate a video from the saved frames."""
-    import cv2
-
-    # List of PNG files
-    files = glob.glob(path + 'image_*.png')
-    image_files = sorted(files, key=lambda x: int(
-        re.search(r'\d+', x[len(path):]).group()))
-
-    # Read first image to get dimensions
-    frame = cv2.imread(image_files[0])
-    h, w, _ = frame.shape
-
-    if not name:
-        name = 'output.mp4'
-    if name[-4:] != '.mp4':
-        name += '.mp4'
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # Codec for mp4 format
-    out = cv2.VideoWriter(path + name, fourcc, fps, (w, h))
-
-    # Write images to video
-    for img_file in image_files:
-        frame = cv2.imread(img_file)  # Read image
-        out.write(frame)  # Write frame
-
-    out.release()  # Save and close file
-    print(f"Video saved as {path}{name}")
-
-
 def main(metadata, x_centre_1, y_centre_1, delta_x_1, delta_y_1,
          x_centre_2, y_centre_2, delta_x_2, delta_y_2, x_c, y_c,
          mode, power, n_regime, n_i, n_f, horizon, frames, length, height, colourmap,
-         c_regime, freq, offset, shading, azdeg, altdeg, vert_exag, threads, supersampling, path):
+         c_regime, freq, offset, shading, azdeg, altdeg, vert_exag, threads, supersampling, path,
+         store=None, keyframes=False, exp_map=False, video=None, png=True):
     """Main function to generate the zoom animation."""
     if not isinstance(colourmap, str):
         colourmap = make_colourmap(colourmap)
@@ -192,16 +316,46 @@ def main(metadata, x_centre_1, y_centre_1, delta_x_1, delta_y_1,
 
     time0 = dt.now()
     scales = 1.0 - np.logspace(0, -50, frames, base=2, dtype=np.float64)
-    pool = mp.Pool(threads)
-    result = [pool.apply_async(make_frame, args=(i, scale, xmin_1, xmax_1, ymin_1, ymax_1, xmin_2, xmax_2,
-                                                 ymin_2, ymax_2, mode, x_c, y_c, power, n_regime, n_i, n_f, horizon,
-                                                 length, height, colourmap, c_regime, freq, offset, shading, azdeg,
-                                                 altdeg, vert_exag, abs(supersampling), path, frames))
-              for i, scale in enumerate(scales)]
-
-    im_arr = [res.get() for res in result]
-    pool.close()
-    pool.join()
+    # Compile once so that the workers only load the kernels from the disk cache (all but the
+    # double-double one, see warm_up_cache). Frames are rendered in the 'yx' layout,
+    # supersampled ones and the tile store use 'xy'
+    deep = 'perturbation' if mode in {'mandelbrot', 'julia'} else 'double_double'
+    warm_up_args = ((mode,), (power,), ('float64', deep), ('xy', 'yx'))
+    warm_up_cache(*warm_up_args)
+    if exp_map and (abs(x_centre_1 - x_centre_2) > delta_x_2 / length
+                    or abs(y_centre_1 - y_centre_2) > delta_y_2 / height):
+        raise ValueError('The exponential map needs the same centre for the initial and final views.')
+    stream = VideoStream(video, length, height) if video else None
+    try:
+        if exp_map:
+            with mp.Pool(threads) as pool:
+                exp_map_animation(pool, scales, x_centre_2, y_centre_2, delta_x_1, delta_y_1, delta_x_2, delta_y_2,
+                                  mode, x_c, y_c, power, n_regime, n_i, n_f, horizon, length, height, colourmap,
+                                  c_regime, freq, offset, shading, azdeg, altdeg, vert_exag, abs(supersampling),
+                                  path, png, stream)
+        elif keyframes:
+            with mp.Pool(threads, initializer=warm_up, initargs=warm_up_args) as pool:
+                keyframe_animation(pool, threads, scales, (xmin_1, xmax_1, ymin_1, ymax_1),
+                                   (xmin_2, xmax_2, ymin_2, ymax_2), mode, x_c, y_c, power, n_regime, n_i, n_f,
+                                   horizon, length, height, colourmap, c_regime, freq, offset, shading, azdeg, altdeg,
+                                   vert_exag, abs(supersampling), path, store, png, stream)
+        else:
+            pool = mp.Pool(threads, initializer=warm_up, initargs=warm_up_args)
+            result = [pool.apply_async(make_frame, args=(i, scale, xmin_1, xmax_1, ymin_1, ymax_1, xmin_2, xmax_2,
+                                                         ymin_2, ymax_2, mode, x_c, y_c, power, n_regime, n_i, n_f,
+                                                         horizon, length, height, colourmap, c_regime, freq, offset,
+                                                         shading, azdeg, altdeg, vert_exag, abs(supersampling), path,
+                                                         frames, store, png, stream is not None),
+                                       callback=stream.callback(i) if stream else None)
+                      for i, scale in enumerate(scales)]
+
+            for res in result:
+                res.get()
+            pool.close()
+            pool.join()
+    finally:
+        if stream:
+            stream.close()
     print('Completed in:', dt.now() - time0)
 
 
@@ -289,6 +443,20 @@ if __name__ == '__main__':
                         help='Number of threads to use for frame creation (default: number of CPU cores - 2).')
     parser.add_argument('-ss', '--supersampling', type=int, default=1,
                         help='Supersampling (SSAA) factor for the image rendering (default: 1).')
+    parser.add_argument('--store', type=str, nargs='?', const=cfg.TILE_STORE_DIR,
+                        help='Read the fields of the frames from, and write them to, the tile store in this '
+                             f'directory (without a value: {cfg.TILE_STORE_DIR}).')
+    parser.add_argument('-k', '--keyframes', action='store_true', default=False,
+                        help='Render one keyframe, oversized and at a higher resolution, per 2x zoom step, and '
+                             'resample every frame from the two keyframes around it instead of rendering it. '
+                             'The supersampling factor raises the resolution of the keyframes.')
+    parser.add_argument('-e', '--exp_map', action='store_true', default=False,
+                        help='For a zoom into a fixed centre (the same centre for the initial and final views), '
+                             'render its exponential map (log-polar strip) once and reproject every frame from it. '
+                             'Takes precedence over --keyframes.')
+    parser.add_argument('--png', action='store_true', default=False,
+                        help='Also save every frame as image_<i>.png. The video is encoded from the frames '
+                             'as they are made either way.')
     args = parser.parse_args()
     if args.horizon is None:
         if args.mode == 'mandelbrot':
@@ -310,7 +478,5 @@ if __name__ == '__main__':
     if path[-1] != '/':
         path += '/'
     os.makedirs(path, exist_ok=True)
-    main(**vars(args), path=path)
     video_name = input('Enter the name for the video (default: output.mp4): ')
-
-    generate_video(path, video_name)
+    main(**vars(args), path=path, video=video_filename(path, video_name))